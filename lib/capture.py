@@ -0,0 +1,102 @@
+import itertools
+import os
+import struct
+import threading
+import time
+from os import PathLike
+from typing import Iterator, Tuple
+
+
+CAPTURE_MAGIC = b'SWPSCAP1'
+
+DIR_IN = 0
+DIR_OUT = 1
+DIR_CLOSE = 2
+# Written when a process starts capturing, session ids restart from 1 after it.
+DIR_RUN = 3
+
+# Timestamp(epoch sec.), SessionId, Direction, Length
+RECORD_HEAD = struct.Struct('<dIBI')
+
+
+class TrafficCapture:
+    def __init__(self) -> None:
+        """Append timestamped edge messages to a capture file for later replay."""
+        self.path = None
+        self.max_bytes = 0
+        self.size = 0
+
+        self._f = None
+        self._ids = itertools.count(1)
+        self._lock = threading.Lock()
+
+    @property
+    def enabled(self) -> bool:
+        return self._f is not None
+
+    def open(self, path: str | PathLike[str], max_bytes: int) -> None:
+        """Start capturing.
+
+        :param path: capture file, appended when it exists
+        :param max_bytes: capturing stops when the file reaches this size
+        """
+        self.path = path
+        self.max_bytes = max_bytes
+
+        f = open(path, 'ab')
+
+        if f.tell() == 0:
+            f.write(CAPTURE_MAGIC)
+
+        f.write(RECORD_HEAD.pack(time.time(), 0, DIR_RUN, 0))
+
+        self.size = f.tell()
+        self._f = f
+
+    def new_session(self) -> int:
+        return next(self._ids)
+
+    def record(self, session_id: int, direction: int, data: bytes = b'') -> None:
+        if self._f is None:
+            return
+
+        with self._lock:
+            if self._f is None:
+                return
+
+            self._f.write(RECORD_HEAD.pack(time.time(), session_id, direction, len(data)))
+            self._f.write(data)
+            self.size += RECORD_HEAD.size + len(data)
+
+            if self.size >= self.max_bytes:
+                self._f.close()
+                self._f = None
+
+    def close(self) -> None:
+        with self._lock:
+            if self._f is not None:
+                self._f.close()
+                self._f = None
+
+
+def read_capture(path: str | PathLike[str]) -> Iterator[Tuple[float, int, int, bytes]]:
+    """Read the records of a capture file.
+
+    :param path: capture file
+    :return: timestamp, session id, direction and payload of each record
+    """
+    with open(path, 'rb') as f:
+        if f.read(len(CAPTURE_MAGIC)) != CAPTURE_MAGIC:
+            raise ValueError(f'{os.fspath(path)} is not a capture file')
+
+        while True:
+            head = f.read(RECORD_HEAD.size)
+            if len(head) < RECORD_HEAD.size:
+                return
+
+            stamp, session_id, direction, length = RECORD_HEAD.unpack(head)
+            data = f.read(length)
+            if len(data) < length:
+                return
+
+            yield stamp, session_id, direction, data
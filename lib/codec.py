@@ -0,0 +1,147 @@
+import json
+import struct
+from datetime import datetime
+from typing import Tuple, Dict, List
+
+from lib.utils import create_data_dict
+
+
+ENCODING_JSON = 'json'
+ENCODING_STRUCT = 'struct'
+SUPPORTED_ENCODINGS = (ENCODING_JSON, ENCODING_STRUCT)
+
+FRAME_SENSOR_RECORD = 0x01
+FRAME_ACK = 0x02
+FRAME_RETRY_AFTER = 0x03
+
+# Tag, Temperature, Humidity, Pressure, RawValue0-3, Voltage0-3, DetectTime(epoch sec.), PumpStartTime(ms)
+SENSOR_RECORD = struct.Struct('<B3f4i4fdI')
+ACK = struct.Struct('<BB')
+# Tag, Result, RetryAfter(sec.)
+RETRY_AFTER = struct.Struct('<BBf')
+
+ACK_SUCCESS = ACK.pack(FRAME_ACK, 1)
+ACK_FAILURE = ACK.pack(FRAME_ACK, 0)
+
+SENSOR_RECORD_FIELDS = (
+    'DeviceSN',
+    'Temperature',
+    'Humidity',
+    'Pressure',
+    'RawValue0',
+    'RawValue1',
+    'RawValue2',
+    'RawValue3',
+    'Voltage0',
+    'Voltage1',
+    'Voltage2',
+    'Voltage3',
+    'DetectTime',
+    'PumpStartTime'
+)
+
+
+def negotiate_encoding(requested: str | List[str] | None) -> str:
+    """Pick the first encoding offered by the edge that the server also supports.
+
+    :param requested: encoding name or names in order of preference
+    :return: agreed encoding, JSON when nothing matches
+    """
+    if isinstance(requested, str):
+        requested = [requested]
+
+    for enc in requested or []:
+        if enc in SUPPORTED_ENCODINGS:
+            return enc
+
+    return ENCODING_JSON
+
+
+def is_struct_frame(data: bytes | memoryview) -> bool:
+    return len(data) > 0 and data[0] == FRAME_SENSOR_RECORD
+
+
+def decode_sensor_record(data: bytes | memoryview, device_sn: str) -> Tuple:
+    """Unpack a struct sensor record frame directly into the SensorRecords insert tuple.
+
+    :param data: received frame, a view of the receive buffer is read without copying
+    :param device_sn: device serial number bound by setup_edge
+    :return: parameters of the SensorRecords insert statement
+    """
+    (_, temp, hum, press, raw0, raw1, raw2, raw3,
+     volt0, volt1, volt2, volt3, detect_time, pump_start_time) = SENSOR_RECORD.unpack_from(data, 0)
+
+    return (
+        device_sn,
+        device_sn,
+        temp,
+        hum,
+        press,
+        raw0,
+        raw1,
+        raw2,
+        raw3,
+        volt0,
+        volt1,
+        volt2,
+        volt3,
+        datetime.fromtimestamp(detect_time),
+        pump_start_time / 1000
+    )
+
+
+def sensor_record_from_dict(data: Dict) -> Tuple:
+    """Convert a JSON sensor record into the SensorRecords insert tuple.
+
+    :param data: 'Data' field of an upload_sensor_record message
+    :return: parameters of the SensorRecords insert statement
+    """
+    return (
+        data['DeviceSN'],
+        data['DeviceSN'],
+        data['Temperature'],
+        data['Humidity'],
+        data['Pressure'],
+        data['RawValue0'],
+        data['RawValue1'],
+        data['RawValue2'],
+        data['RawValue3'],
+        data['Voltage0'],
+        data['Voltage1'],
+        data['Voltage2'],
+        data['Voltage3'],
+        datetime.fromtimestamp(data['DetectTime']),
+        data['PumpStartTime'] / 1000
+    )
+
+
+def sensor_record_to_dict(data_record: Tuple) -> Dict:
+    """Convert a SensorRecords insert tuple into a JSON friendly event payload.
+
+    :param data_record: parameters of the SensorRecords insert statement
+    :return: sensor record with edge protocol field names
+    """
+    data = dict(zip(SENSOR_RECORD_FIELDS, data_record[1:]))
+    data['DetectTime'] = data['DetectTime'].timestamp()
+
+    return data
+
+
+def encode_replies(sys_encoding: str) -> Tuple[bytes, bytes]:
+    """Most replies are constant, encode them once per connection.
+
+    :param sys_encoding: text encoding of the connection, JSON is not ASCII compatible in every encoding
+    :return: success reply, failure reply
+    """
+    return (
+        json.dumps(create_data_dict('', True, {})).encode(sys_encoding),
+        json.dumps(create_data_dict('', False, {})).encode(sys_encoding)
+    )
+
+
+def encode_ack(result: bool) -> bytes:
+    return ACK_SUCCESS if result else ACK_FAILURE
+
+
+def encode_retry_after(seconds: float) -> bytes:
+    return RETRY_AFTER.pack(FRAME_RETRY_AFTER, 0, seconds)
@@ -0,0 +1,298 @@
+import logging
+import threading
+import time
+from collections import OrderedDict
+from typing import Tuple, Any, Callable
+
+import mysql.connector
+import mysql.connector.pooling
+
+from lib.metrics import Metrics
+
+
+INSERT_SENSOR_RECORD = (
+    "INSERT INTO SensorRecords "
+    "(UserID, DeviceId, Temperature, Humidity, Pressure, RawValue0, RawValue1, RawValue2, "
+    "RawValue3, Voltage0, Voltage1, Voltage2, Voltage3, DetectTime, PumpStartTime) "
+    "VALUES ((SELECT UserId FROM EdgeDevices WHERE DeviceSN = %s), "
+    "(SELECT Id FROM EdgeDevices WHERE DeviceSN = %s), "
+    "%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s) "
+    # With a unique index on (DeviceId, DetectTime) a retransmitted record is a no-op.
+    "ON DUPLICATE KEY UPDATE DetectTime = DetectTime"
+)
+
+SELECT_EDGE_PARAMS = (
+    "SELECT DetectInterval, PumpStartTime, SoilMoisture "
+    "FROM EdgeDevices "
+    "WHERE DeviceSN = %s"
+)
+
+SENSOR_RECORD_COLUMNS = (
+    'DetectTime',
+    'Temperature',
+    'Humidity',
+    'Pressure',
+    'RawValue0',
+    'RawValue1',
+    'RawValue2',
+    'RawValue3',
+    'Voltage0',
+    'Voltage1',
+    'Voltage2',
+    'Voltage3',
+    'PumpStartTime'
+)
+
+# Keyset pagination on (DetectTime, Id) per device, Id breaks ties of records detected at the same time.
+# Rows are SENSOR_RECORD_COLUMNS followed by Id, the first page includes the start time.
+SELECT_SENSOR_RECORDS_FIRST = (
+    "SELECT " + ", ".join(SENSOR_RECORD_COLUMNS) + ", Id "
+    "FROM SensorRecords "
+    "WHERE DeviceId = (SELECT Id FROM EdgeDevices WHERE DeviceSN = %s) "
+    "AND DetectTime >= %s AND DetectTime < %s "
+    "ORDER BY DetectTime, Id "
+    "LIMIT %s"
+)
+
+# Parameters: DeviceSN, after DetectTime, after DetectTime, after Id, end DetectTime, limit.
+SELECT_SENSOR_RECORDS_NEXT = (
+    "SELECT " + ", ".join(SENSOR_RECORD_COLUMNS) + ", Id "
+    "FROM SensorRecords "
+    "WHERE DeviceId = (SELECT Id FROM EdgeDevices WHERE DeviceSN = %s) "
+    "AND (DetectTime > %s OR (DetectTime = %s AND Id > %s)) AND DetectTime < %s "
+    "ORDER BY DetectTime, Id "
+    "LIMIT %s"
+)
+
+# The server or the session is gone, as opposed to errors of the statement itself.
+DB_UNAVAILABLE_ERRORS = (mysql.connector.errors.OperationalError, mysql.connector.errors.InterfaceError)
+
+
+class RecentKeys:
+    def __init__(self, max_keys: int = 4096) -> None:
+        """Thread safe bounded LRU set of recently seen keys, recognizes retransmitted records before MySQL does.
+
+        :param max_keys: number of keys remembered
+        """
+        self.max_keys = max_keys
+
+        self._keys = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __contains__(self, key: Any) -> bool:
+        with self._lock:
+            if key in self._keys:
+                self._keys.move_to_end(key)
+                return True
+
+        return False
+
+    def add(self, key: Any) -> None:
+        with self._lock:
+            self._keys[key] = None
+            self._keys.move_to_end(key)
+
+            if len(self._keys) > self.max_keys:
+                self._keys.popitem(last=False)
+
+
+BREAKER_CLOSED = 'closed'
+BREAKER_OPEN = 'open'
+BREAKER_HALF_OPEN = 'half_open'
+
+
+class CircuitBreaker:
+    def __init__(self, failure_threshold: int = 3, reset_timeout: float = 10.) -> None:
+        """Thread safe circuit breaker, callers skip a failing dependency while it is open.
+
+        After reset_timeout an open breaker becomes half-open for a single probe,
+        whose result closes or opens it again.
+
+        :param failure_threshold: consecutive failures that open the breaker
+        :param reset_timeout: seconds to stay open before probing
+        """
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+
+        self.state = BREAKER_CLOSED
+        self.failures = 0
+        self.opened_at = 0.
+        self._lock = threading.Lock()
+
+    def allow(self) -> bool:
+        return self.state == BREAKER_CLOSED
+
+    def probe_due(self) -> bool:
+        """Move an open breaker to half-open once reset_timeout has passed.
+
+        :return: True when the caller should probe now
+        """
+        with self._lock:
+            if self.state == BREAKER_OPEN and time.monotonic() - self.opened_at >= self.reset_timeout:
+                self.state = BREAKER_HALF_OPEN
+                return True
+
+        return False
+
+    def record_success(self) -> bool:
+        """Reset the failure count after a successful call.
+
+        :return: True when this closed the breaker
+        """
+        with self._lock:
+            closed = self.state != BREAKER_CLOSED
+            self.state = BREAKER_CLOSED
+            self.failures = 0
+
+        return closed
+
+    def record_failure(self) -> bool:
+        """Count a failed call, a failed probe opens the breaker again at once.
+
+        :return: True when this opened a closed breaker
+        """
+        with self._lock:
+            self.failures += 1
+
+            if self.state == BREAKER_HALF_OPEN or (
+                self.state == BREAKER_CLOSED and self.failures >= self.failure_threshold
+            ):
+                opened = self.state == BREAKER_CLOSED
+                self.state = BREAKER_OPEN
+                self.opened_at = time.monotonic()
+
+                return opened
+
+        return False
+
+
+class LazyConnectionPool:
+    def __init__(self, on_create: Callable[[], None] = None, **kwargs) -> None:
+        """MySQL connection pool created when the first connection is taken, startup does not need MySQL.
+
+        :param on_create: called once the pool was created
+        :param kwargs: MySQLConnectionPool arguments
+        """
+        self.on_create = on_create
+        self.kwargs = kwargs
+
+        self._pool = None
+        self._lock = threading.Lock()
+
+    def get_connection(self) -> mysql.connector.pooling.PooledMySQLConnection:
+        """Take a pooled connection, creating the pool first if needed.
+
+        :return: mysql connection, raises the connection errors of MySQLConnectionPool
+        """
+        with self._lock:
+            if self._pool is None:
+                self._pool = mysql.connector.pooling.MySQLConnectionPool(**self.kwargs)
+
+                if self.on_create is not None:
+                    self.on_create()
+
+        return self._pool.get_connection()
+
+
+class StatementCache:
+    def __init__(self, cnx: mysql.connector.pooling.PooledMySQLConnection) -> None:
+        """Server-side prepared statements kept for the lifetime of a pooled connection.
+
+        Each statement gets its own prepared cursor, so it is prepared once and only
+        executed afterwards. The cache is dropped when the connection id changes,
+        statements are then prepared again on the new session.
+
+        :param cnx: mysql connection
+        """
+        self.cnx = cnx
+
+        self._cursors = {}
+        self._cnx_id = None
+
+    def _cursor(self, query: str, dictionary: bool) -> Any:
+        cnx_id = self.cnx.connection_id
+
+        if cnx_id != self._cnx_id:
+            self._cursors.clear()
+            self._cnx_id = cnx_id
+
+        key = (query, dictionary)
+        if key not in self._cursors:
+            self._cursors[key] = self.cnx.cursor(prepared=True, dictionary=dictionary)
+
+        return self._cursors[key]
+
+    def execute(self, query: str, params: Tuple, dictionary: bool = False) -> Any:
+        """Execute a prepared statement, reconnecting and preparing it again once if the session was lost.
+
+        :param query: statement with %s placeholders
+        :param params: statement parameters
+        :param dictionary: return rows as dictionaries
+        :return: prepared cursor, fetch all rows before the next execute
+        """
+        try:
+            cursor = self._cursor(query, dictionary)
+            cursor.execute(query, params)
+
+        except (mysql.connector.errors.OperationalError, mysql.connector.errors.InterfaceError):
+            self._cursors.clear()
+            self.cnx.reconnect(attempts=1)
+
+            cursor = self._cursor(query, dictionary)
+            cursor.execute(query, params)
+
+        return cursor
+
+    def close(self) -> None:
+        for cursor in self._cursors.values():
+            try:
+                cursor.close()
+
+            except mysql.connector.errors.Error:
+                pass
+
+        self._cursors.clear()
+
+
+def report_db_failure(
+    err: BaseException,
+    breaker: CircuitBreaker,
+    metrics: Metrics,
+    logger: logging.Logger
+) -> None:
+    if breaker.record_failure():
+        metrics.inc('db_breaker_opened')
+        logger.error(f'MySQL is unavailable, failing over to local storage! Error: {err!r}')
+
+    else:
+        logger.warning(f'MySQL request failed! Error: {err!r}', extra={'rate_key': 'db_failed'})
+
+
+def get_db_connection(
+    cnxpool: LazyConnectionPool,
+    breaker: CircuitBreaker,
+    metrics: Metrics,
+    logger: logging.Logger
+) -> mysql.connector.pooling.PooledMySQLConnection | None:
+    """Take a pooled connection, without waiting on MySQL while the circuit breaker is open.
+
+    :param cnxpool: mysql connection pool
+    :param breaker: circuit breaker of the database
+    :param metrics: counters of the process
+    :param logger: logger for failures
+    :return: mysql connection, None when MySQL is unavailable or the pool is exhausted
+    """
+    if not breaker.allow():
+        return None
+
+    try:
+        return cnxpool.get_connection()
+
+    except mysql.connector.errors.PoolError as err:
+        logger.warning(f'Failed to get mysql connection! Error: {err!r}', extra={'rate_key': 'pool_exhausted'})
+
+    # Connecting can also fail with DatabaseError or ProgrammingError, depending on the connector.
+    except mysql.connector.errors.Error as err:
+        report_db_failure(err, breaker, metrics, logger)
+
+    return None
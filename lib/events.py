@@ -0,0 +1,124 @@
+import itertools
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, List, Iterable, Tuple
+
+
+EVENT_EDGE_STATUS = 'edge_status'
+EVENT_SENSOR_RECORD = 'sensor_record'
+EVENT_SERIAL_STATUS = 'serial_status'
+EVENT_DROPPED = 'dropped'
+ALL_EVENTS = (EVENT_EDGE_STATUS, EVENT_SENSOR_RECORD, EVENT_SERIAL_STATUS)
+
+
+def parse_events(events: str | List[str] | None) -> Tuple[str, ...]:
+    """Validate the event names requested by a subscriber.
+
+    :param events: event name or names, all events when empty
+    :return: requested event names
+    """
+    if not events:
+        return ALL_EVENTS
+
+    if isinstance(events, str):
+        events = [events]
+
+    if not isinstance(events, list):
+        raise ValueError(f'Events must be a name or a list of names, got {events!r}')
+
+    unknown = [e for e in events if e not in ALL_EVENTS]
+    if unknown:
+        raise ValueError(f'Unknown events {unknown}')
+
+    return tuple(events)
+
+
+class Subscription:
+    def __init__(self, events: Iterable[str], max_events: int) -> None:
+        """Bounded event queue of one subscriber.
+
+        Events published with a key replace the pending event with the same key,
+        other events are dropped oldest first when the queue is full.
+
+        :param events: event names to receive
+        :param max_events: maximum number of pending events
+        """
+        self.events = frozenset(events)
+        self.max_events = max(1, max_events)
+        self.dropped = 0
+
+        self._pending = OrderedDict()
+        self._seq = itertools.count()
+        self._cond = threading.Condition()
+
+    def put(self, event: Dict, key: str = None) -> None:
+        with self._cond:
+            if key is not None and key in self._pending:
+                self._pending[key] = event
+
+            else:
+                if len(self._pending) >= self.max_events:
+                    self._pending.popitem(last=False)
+                    self.dropped += 1
+
+                self._pending[key if key is not None else next(self._seq)] = event
+
+            self._cond.notify()
+
+    def get(self, timeout: float) -> List[Dict]:
+        """Wait for pending events and take all of them.
+
+        :param timeout: maximum waiting time
+        :return: pending events, a 'dropped' event first if any were lost
+        """
+        with self._cond:
+            if not self._pending and not self.dropped:
+                self._cond.wait(timeout)
+
+            events = list(self._pending.values())
+            self._pending.clear()
+
+            if self.dropped:
+                events.insert(0, {'Event': EVENT_DROPPED, 'Time': time.time(), 'Data': {'Count': self.dropped}})
+                self.dropped = 0
+
+        return events
+
+
+class EventBus:
+    def __init__(self) -> None:
+        """Fan out system events to web client subscribers."""
+        self._subs = []
+        self._lock = threading.Lock()
+
+    def subscribe(self, events: Iterable[str], max_events: int) -> Subscription:
+        sub = Subscription(events, max_events)
+
+        with self._lock:
+            self._subs.append(sub)
+
+        return sub
+
+    def unsubscribe(self, sub: Subscription) -> None:
+        with self._lock:
+            if sub in self._subs:
+                self._subs.remove(sub)
+
+    def publish(self, event: str, data: Dict, key: str = None) -> None:
+        """Deliver an event to every subscriber interested in it.
+
+        :param event: event name
+        :param data: event payload
+        :param key: coalescing key, newer events replace pending ones with the same key
+        """
+        with self._lock:
+            subs = [s for s in self._subs if event in s.events]
+
+        if not subs:
+            return
+
+        msg = {'Event': event, 'Time': time.time(), 'Data': data}
+
+        for s in subs:
+            s.put(msg, key)
@@ -0,0 +1,217 @@
+import ast
+import csv
+import os
+import pathlib
+import struct
+from datetime import datetime, timedelta
+from os import PathLike
+from typing import List, Iterable, Sequence
+
+from lib.db import SENSOR_RECORD_COLUMNS
+
+
+NPY_MAGIC = b'\x93NUMPY\x01\x00'
+# Fixed header size, so the row count can be rewritten in place.
+NPY_HEADER_SIZE = 128
+# DetectTime is a naive wall clock time, it is exported as is, without a time zone conversion.
+EPOCH = datetime(1970, 1, 1)
+MICROSECOND = timedelta(microseconds=1)
+
+# NumPy dtype and struct format of each exported column, DetectTime is datetime64[us].
+COLUMN_TYPES = {
+    'DetectTime': ('<M8[us]', 'q'),
+    'Temperature': ('<f8', 'd'),
+    'Humidity': ('<f8', 'd'),
+    'Pressure': ('<f8', 'd'),
+    'RawValue0': ('<i4', 'i'),
+    'RawValue1': ('<i4', 'i'),
+    'RawValue2': ('<i4', 'i'),
+    'RawValue3': ('<i4', 'i'),
+    'Voltage0': ('<f8', 'd'),
+    'Voltage1': ('<f8', 'd'),
+    'Voltage2': ('<f8', 'd'),
+    'Voltage3': ('<f8', 'd'),
+    'PumpStartTime': ('<f8', 'd')
+}
+
+
+def _npy_header(descr: str, count: int) -> bytes:
+    head = repr({'descr': descr, 'fortran_order': False, 'shape': (count, )}).encode('latin1')
+    pad = NPY_HEADER_SIZE - len(NPY_MAGIC) - 2 - len(head) - 1
+
+    return NPY_MAGIC + struct.pack('<H', NPY_HEADER_SIZE - len(NPY_MAGIC) - 2) + head + b' ' * pad + b'\n'
+
+
+class NpyColumn:
+    def __init__(self, path: str | PathLike[str], descr: str, fmt: str) -> None:
+        """Append-only one dimensional .npy file, readable with numpy.load(path, mmap_mode='r').
+
+        :param path: column file
+        :param descr: NumPy dtype description
+        :param fmt: struct format character of one value
+        """
+        self.path = pathlib.Path(path)
+        self.descr = descr
+        self.fmt = fmt
+        self.itemsize = struct.calcsize('<' + fmt)
+
+        if self.path.is_file():
+            with open(self.path, 'rb') as f:
+                head = f.read(NPY_HEADER_SIZE)
+
+            if head[:len(NPY_MAGIC)] != NPY_MAGIC:
+                raise ValueError(f'{self.path} is not a column file')
+
+            info = ast.literal_eval(head[len(NPY_MAGIC) + 2:].decode('latin1').strip())
+            if info['descr'] != descr:
+                raise ValueError(f'{self.path} has dtype {info["descr"]}, expected {descr}')
+
+            self.count = info['shape'][0]
+
+        else:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            self.count = 0
+
+        self.truncate(self.count)
+        self.f = open(self.path, 'r+b')
+
+    def truncate(self, count: int) -> None:
+        """Drop rows past count, e.g. left behind by an interrupted append."""
+        self.count = count
+
+        with open(self.path, 'ab') as f:
+            f.truncate(NPY_HEADER_SIZE + count * self.itemsize)
+
+        with open(self.path, 'r+b') as f:
+            f.write(_npy_header(self.descr, self.count))
+
+    def append(self, values: Sequence) -> None:
+        self.f.seek(NPY_HEADER_SIZE + self.count * self.itemsize)
+        self.f.write(struct.pack(f'<{len(values)}{self.fmt}', *values))
+        self.count += len(values)
+
+    def commit(self) -> None:
+        self.f.flush()
+        self.f.seek(0)
+        self.f.write(_npy_header(self.descr, self.count))
+        self.f.flush()
+
+    def last(self) -> int | float | None:
+        if not self.count:
+            return None
+
+        self.f.seek(NPY_HEADER_SIZE + (self.count - 1) * self.itemsize)
+
+        return struct.unpack('<' + self.fmt, self.f.read(self.itemsize))[0]
+
+    def close(self) -> None:
+        self.f.close()
+
+
+class ColumnarExporter:
+    def __init__(self, out_dir: str | PathLike[str], device_sn: str) -> None:
+        """Per-device columnar segments of SensorRecords, appended incrementally.
+
+        :param out_dir: export folder, each device gets a sub folder
+        :param device_sn: device serial number
+        """
+        self.device_sn = device_sn
+        self.columns = {
+            k: NpyColumn(pathlib.Path(out_dir, device_sn, f'{k}.npy'), *COLUMN_TYPES[k])
+            for k in SENSOR_RECORD_COLUMNS
+        }
+
+        # Columns are committed one by one, keep the rows all of them have.
+        count = min(c.count for c in self.columns.values())
+        for c in self.columns.values():
+            if c.count != count:
+                c.truncate(count)
+
+    @property
+    def count(self) -> int:
+        return self.columns['DetectTime'].count
+
+    def last_detect_time(self) -> datetime | None:
+        last = self.columns['DetectTime'].last()
+
+        return None if last is None else EPOCH + last * MICROSECOND
+
+    def append(self, rows: List[Sequence]) -> None:
+        """Append rows ordered like SENSOR_RECORD_COLUMNS, DetectTime as datetime.
+
+        :param rows: sensor records
+        """
+        if not rows:
+            return
+
+        for i, (k, c) in enumerate(self.columns.items()):
+            if k == 'DetectTime':
+                values = [(r[i] - EPOCH) // MICROSECOND for r in rows]
+
+            elif c.fmt == 'i':
+                values = [int(r[i]) for r in rows]
+
+            else:
+                values = [float(r[i]) for r in rows]
+
+            c.append(values)
+
+        for c in self.columns.values():
+            c.commit()
+
+    def close(self) -> None:
+        for c in self.columns.values():
+            c.close()
+
+
+def read_local_csv(
+    csv_path: str | PathLike[str],
+    encoding: str,
+    after: datetime | None
+) -> Iterable[List]:
+    """Read the local fallback records written by SmartWaterPumpSystem.
+
+    :param csv_path: local record file
+    :param encoding: file encoding
+    :param after: only records detected after this time
+    :return: rows ordered like SENSOR_RECORD_COLUMNS
+    """
+    if not os.path.isfile(csv_path):
+        return
+
+    with open(csv_path, 'r', newline='', encoding=encoding) as f:
+        for row in csv.DictReader(f, dialect='excel'):
+            # The header is written again whenever the file was recreated.
+            if row['DetectTime'] == 'DetectTime':
+                continue
+
+            detect_time = datetime.strptime(row['DetectTime'], '%Y-%m-%d %H:%M:%S.%f')
+            if after is not None and detect_time <= after:
+                continue
+
+            yield [detect_time] + [float(row[k]) for k in SENSOR_RECORD_COLUMNS[1:]]
+
+
+def export_rows(exporter: ColumnarExporter, rows: Iterable[Sequence], chunk_size: int = 1000) -> int:
+    """Append rows to the exporter in chunks.
+
+    :param exporter: device exporter
+    :param rows: rows ordered like SENSOR_RECORD_COLUMNS
+    :param chunk_size: rows per commit
+    :return: number of rows appended
+    """
+    count = 0
+    chunk = []
+
+    for row in rows:
+        chunk.append(row)
+
+        if len(chunk) >= chunk_size:
+            exporter.append(chunk)
+            count += len(chunk)
+            chunk = []
+
+    exporter.append(chunk)
+    count += len(chunk)
+
+    return count
@@ -0,0 +1,276 @@
+import math
+import threading
+import time
+from typing import Tuple, Dict, List, Callable, Any
+
+from lib.events import EventBus, EVENT_EDGE_STATUS
+
+
+class TimerWheel:
+    def __init__(self, slots: int, tick: float) -> None:
+        """Hashed timer wheel, scheduling and cancelling are O(1).
+
+        :param slots: number of wheel slots
+        :param tick: seconds per slot
+        """
+        self.tick = tick
+        self.cursor = 0
+
+        self._slots = [{} for _ in range(slots)]
+        self._where = {}
+
+    def schedule(self, item: Any, delay: float) -> None:
+        self.cancel(item)
+
+        ticks = max(1, math.ceil(delay / self.tick))
+        idx = (self.cursor + ticks) % len(self._slots)
+
+        self._slots[idx][item] = (ticks - 1) // len(self._slots)
+        self._where[item] = idx
+
+    def cancel(self, item: Any) -> None:
+        idx = self._where.pop(item, None)
+
+        if idx is not None:
+            self._slots[idx].pop(item, None)
+
+    def advance(self) -> List[Any]:
+        """Move the wheel forward one tick.
+
+        :return: items whose timer fired
+        """
+        self.cursor = (self.cursor + 1) % len(self._slots)
+        slot = self._slots[self.cursor]
+
+        fired = []
+        for item, rounds in list(slot.items()):
+            if rounds:
+                slot[item] = rounds - 1
+
+            else:
+                del slot[item]
+                del self._where[item]
+                fired.append(item)
+
+        return fired
+
+
+class EdgeSession:
+    def __init__(
+        self,
+        address: Tuple,
+        timeout: float,
+        on_expire: Callable[[], None] = None
+    ) -> None:
+        """Liveness state of one edge connection.
+
+        :param address: remote address of the edge
+        :param timeout: seconds of silence before the session expires, 0 to never expire
+        :param on_expire: called when the session expired
+        """
+        self.address = f'{address[0]}[{address[1]}]' if address else ''
+        self.timeout = timeout
+        self.on_expire = on_expire
+        self.device_sn = ''
+        self.session_start = time.time()
+        self.last_seen = self.session_start
+        self.messages = 0
+        self.alive = True
+
+    def to_dict(self) -> Dict:
+        return {
+            'DeviceSN': self.device_sn,
+            'Status': self.alive,
+            'Address': self.address,
+            'SessionStart': self.session_start,
+            'LastSeen': self.last_seen,
+            'Messages': self.messages
+        }
+
+    @classmethod
+    def from_dict(cls, data: Dict) -> 'EdgeSession':
+        session = cls((), 0)
+        session.device_sn = data['DeviceSN']
+        session.alive = data['Status']
+        session.address = data['Address']
+        session.session_start = data['SessionStart']
+        session.last_seen = data['LastSeen']
+        session.messages = data['Messages']
+
+        return session
+
+
+class EdgeRegistry:
+    def __init__(self, bus: EventBus, slots: int = 512, tick: float = 1.) -> None:
+        """Track edge sessions and expire silent ones.
+
+        :param bus: where edge status changes are published
+        :param slots: number of timer wheel slots
+        :param tick: seconds per timer wheel slot
+        """
+        self.bus = bus
+        # Only edge worker processes mirror their changes to the main process.
+        self.track_dirty = False
+
+        self._devices = {}
+        self._admitted = 0
+        self._dirty = set()
+        self._wheel = TimerWheel(slots, tick)
+        self._lock = threading.Lock()
+
+    @property
+    def tick(self) -> float:
+        return self._wheel.tick
+
+    def _mark_dirty(self, session: EdgeSession) -> None:
+        # Caller holds the lock.
+        if self.track_dirty:
+            self._dirty.add(session)
+
+    def _publish(self, session: EdgeSession) -> None:
+        self.bus.publish(
+            EVENT_EDGE_STATUS,
+            {'DeviceSN': session.device_sn, 'Status': session.alive},
+            EVENT_EDGE_STATUS + session.device_sn
+        )
+
+    def try_admit(self, limit: int) -> bool:
+        """Reserve one of the limited concurrent session slots.
+
+        :param limit: maximum number of concurrent sessions
+        :return: whether a slot was reserved, release it with release_admission
+        """
+        with self._lock:
+            if self._admitted >= limit:
+                return False
+
+            self._admitted += 1
+
+        return True
+
+    def release_admission(self) -> None:
+        with self._lock:
+            self._admitted = max(0, self._admitted - 1)
+
+    @property
+    def admitted(self) -> int:
+        return self._admitted
+
+    def open_session(
+        self,
+        address: Tuple,
+        timeout: float,
+        on_expire: Callable[[], None] = None
+    ) -> EdgeSession:
+        session = EdgeSession(address, timeout, on_expire)
+
+        if timeout > 0:
+            with self._lock:
+                self._wheel.schedule(session, timeout)
+
+        return session
+
+    def bind(self, session: EdgeSession, device_sn: str) -> None:
+        """Attach a session to the device it identified itself as.
+
+        :param session: edge session
+        :param device_sn: device serial number
+        """
+        with self._lock:
+            if session.device_sn and self._devices.get(session.device_sn) is session:
+                del self._devices[session.device_sn]
+
+            session.device_sn = device_sn
+            self._devices[device_sn] = session
+            self._mark_dirty(session)
+
+        self._publish(session)
+
+    def register_local(self, device_sn: str) -> None:
+        session = self.open_session(('localhost', 0), 0)
+        self.bind(session, device_sn)
+
+    def touch(self, session: EdgeSession) -> None:
+        # Lazy update, the wheel re-checks last_seen when the timer fires.
+        session.last_seen = time.time()
+        session.messages += 1
+
+        if self.track_dirty:
+            with self._lock:
+                self._dirty.add(session)
+
+    def close_session(self, session: EdgeSession) -> None:
+        with self._lock:
+            self._wheel.cancel(session)
+            changed = session.alive and self._devices.get(session.device_sn) is session
+            session.alive = False
+            # The callback references the session handler, let it be freed.
+            session.on_expire = None
+            self._mark_dirty(session)
+
+        if changed:
+            self._publish(session)
+
+    def advance(self) -> None:
+        """Fire one timer wheel tick and expire silent sessions."""
+        now = time.time()
+        expired = []
+
+        with self._lock:
+            for session in self._wheel.advance():
+                remain = session.last_seen + session.timeout - now
+
+                if remain > 0:
+                    self._wheel.schedule(session, remain)
+
+                elif session.alive:
+                    session.alive = False
+                    self._mark_dirty(session)
+                    expired.append((session, self._devices.get(session.device_sn) is session, session.on_expire))
+
+        for session, current, on_expire in expired:
+            if current:
+                self._publish(session)
+
+            if on_expire:
+                on_expire()
+
+    def drain_dirty(self) -> List[Dict]:
+        """Take the devices changed since the last drain, to mirror them in another process."""
+        with self._lock:
+            dirty = self._dirty
+            self._dirty = set()
+
+            return [s.to_dict() for s in dirty if s.device_sn]
+
+    def merge(self, records: List[Dict]) -> None:
+        """Mirror device records drained from a registry in another process.
+
+        :param records: device records from drain_dirty
+        """
+        changed = []
+
+        with self._lock:
+            for r in records:
+                old = self._devices.get(r['DeviceSN'])
+
+                # A reconnect may land on another process, keep the newest session.
+                if old is not None and old.session_start > r['SessionStart']:
+                    continue
+
+                session = EdgeSession.from_dict(r)
+                self._devices[session.device_sn] = session
+
+                if old is None or old.alive != session.alive:
+                    changed.append(session)
+
+        for session in changed:
+            self._publish(session)
+
+    def snapshot(self) -> List[Dict]:
+        with self._lock:
+            return [s.to_dict() for s in self._devices.values()]
+
+    def status(self) -> Dict[str, bool]:
+        with self._lock:
+            return {k: s.alive for k, s in self._devices.items()}
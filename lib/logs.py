@@ -0,0 +1,144 @@
+import logging
+import logging.handlers
+import queue
+import threading
+from collections import OrderedDict
+from configparser import ConfigParser
+from typing import Tuple, Any
+
+from lib.ratelimit import TokenBucket
+
+
+class RateLimitFilter(logging.Filter):
+    def __init__(self, rate: float, burst: float, max_keys: int = 1024) -> None:
+        """Drop repeated log records beyond a per-key budget.
+
+        Records are keyed by their 'rate_key' extra, or by logger, level and message
+        so identical messages are deduplicated. The number of suppressed records is
+        appended to the next record that passes.
+
+        :param rate: records per second allowed for each key
+        :param burst: records allowed at once for each key
+        :param max_keys: number of keys remembered
+        """
+        super().__init__()
+
+        self.rate = rate
+        self.burst = burst
+        self.max_keys = max_keys
+
+        self._buckets = OrderedDict()
+        self._lock = threading.Lock()
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        key = getattr(record, 'rate_key', None) or (record.name, record.levelno, record.msg)
+
+        with self._lock:
+            if key in self._buckets:
+                self._buckets.move_to_end(key)
+                bucket, suppressed = self._buckets[key]
+
+            else:
+                if len(self._buckets) >= self.max_keys:
+                    self._buckets.popitem(last=False)
+
+                bucket, suppressed = TokenBucket(self.rate, self.burst), 0
+
+            if not bucket.consume():
+                self._buckets[key] = (bucket, suppressed + 1)
+                return False
+
+            self._buckets[key] = (bucket, 0)
+
+        if suppressed:
+            record.msg = f'{record.msg} ({suppressed} similar messages suppressed)'
+
+        return True
+
+
+class DroppingQueueHandler(logging.handlers.QueueHandler):
+    def __init__(self, q: queue.Queue) -> None:
+        """Queue handler that never blocks the caller, records are dropped when the queue is full.
+
+        The number of dropped records is logged as a warning once the queue has room again.
+        """
+        super().__init__(q)
+
+        self.dropped = 0
+        self._unreported = 0
+
+    def enqueue(self, record: logging.LogRecord) -> None:
+        # Called with the handler lock held.
+        try:
+            self.queue.put_nowait(record)
+
+        except queue.Full:
+            self.dropped += 1
+            self._unreported += 1
+            return
+
+        if self._unreported:
+            report = logging.makeLogRecord({
+                'name': record.name,
+                'levelno': logging.WARNING,
+                'levelname': logging.getLevelName(logging.WARNING),
+                'msg': f'{self._unreported} log records dropped, the log queue was full.'
+            })
+
+            try:
+                self.queue.put_nowait(report)
+                self._unreported = 0
+
+            except queue.Full:
+                pass
+
+
+def setup_logger(cfg: ConfigParser) -> Tuple[logging.Logger, logging.handlers.QueueListener]:
+    """Log through a background thread so callers never wait on disk I/O.
+
+    :param cfg: system setting
+    :return: root logger and the started queue listener, stop it before exiting
+    """
+    logger = logging.getLogger('root')
+    logger.setLevel(logging.INFO)
+    ch = logging.StreamHandler()
+    fh = logging.handlers.RotatingFileHandler(
+        filename=cfg['Default']['log_path'],
+        mode='a',
+        maxBytes=int(cfg['Default']['log_max_bytes']),
+        backupCount=int(cfg['Default']['log_backup_count']),
+        encoding='utf-8'
+    )
+
+    ch.setLevel(logging.INFO)
+    fh.setLevel(logging.INFO)
+    formatter = logging.Formatter(
+        '%(asctime)s | %(name)s | %(levelname)s : %(message)s'
+    )
+
+    ch.setFormatter(formatter)
+    fh.setFormatter(formatter)
+
+    rate = float(cfg['Default']['log_rate_limit(per min.)'])
+    qh = DroppingQueueHandler(queue.Queue(int(cfg['Default']['log_queue_size'])))
+    qh.addFilter(RateLimitFilter(rate / 60, max(1., rate)))
+    logger.addHandler(qh)
+
+    listener = logging.handlers.QueueListener(qh.queue, ch, fh, respect_handler_level=True)
+    listener.start()
+
+    return logger, listener
+
+
+def setup_worker_logger(q: Any, name: str) -> logging.Logger:
+    """Send the log records of a worker process to the main process queue listener.
+
+    :param q: multiprocessing queue read by the main process
+    :param name: logger name of the worker
+    :return: worker logger
+    """
+    root = logging.getLogger('root')
+    root.setLevel(logging.INFO)
+    root.addHandler(logging.handlers.QueueHandler(q))
+
+    return logging.getLogger(name)
@@ -0,0 +1,32 @@
+import threading
+from typing import Dict
+
+
+class Metrics:
+    def __init__(self) -> None:
+        """Thread safe counters, deltas can be drained to another process."""
+        self._counters = {}
+        self._delta = {}
+        self._lock = threading.Lock()
+
+    def inc(self, name: str, value: int = 1) -> None:
+        with self._lock:
+            self._counters[name] = self._counters.get(name, 0) + value
+            self._delta[name] = self._delta.get(name, 0) + value
+
+    def snapshot(self) -> Dict[str, int]:
+        with self._lock:
+            return self._counters.copy()
+
+    def drain(self) -> Dict[str, int]:
+        """Take the changes since the last drain."""
+        with self._lock:
+            delta = self._delta
+            self._delta = {}
+
+        return delta
+
+    def merge(self, delta: Dict[str, int]) -> None:
+        with self._lock:
+            for k, v in delta.items():
+                self._counters[k] = self._counters.get(k, 0) + v
@@ -0,0 +1,153 @@
+import contextlib
+import sys
+import threading
+import time
+from collections import Counter
+from typing import Dict, ContextManager
+
+
+# Shorter sampling intervals keep a core busy on a Raspberry Pi.
+MIN_SAMPLE_INTERVAL = 0.001
+
+class _Stage:
+    __slots__ = ('profiler', 'name', 'start')
+
+    def __init__(self, profiler: 'Profiler', name: str) -> None:
+        self.profiler = profiler
+        self.name = name
+        self.start = 0.
+
+    def __enter__(self) -> None:
+        self.start = time.perf_counter()
+
+    def __exit__(self, *exc) -> None:
+        self.profiler.record(self.name, time.perf_counter() - self.start)
+
+
+class Profiler:
+    def __init__(self, max_depth: int = 30) -> None:
+        """Request stage timing and an optional sampling profiler, switched on at runtime.
+
+        :param max_depth: maximum stack depth kept per sample
+        """
+        self.enabled = False
+        self.max_depth = max_depth
+        self.since = 0.
+
+        self._stages = {}
+        self._samples = Counter()
+        self._sampler = None
+        self._stop = threading.Event()
+        self._lock = threading.Lock()
+        self._null = contextlib.nullcontext()
+
+    def stage(self, name: str) -> ContextManager:
+        """Time a block of code, costs almost nothing while profiling is off.
+
+        :param name: stage name
+        """
+        if not self.enabled:
+            return self._null
+
+        return _Stage(self, name)
+
+    def record(self, name: str, seconds: float) -> None:
+        with self._lock:
+            s = self._stages.get(name)
+
+            if s is None:
+                self._stages[name] = [1, seconds, seconds]
+
+            else:
+                s[0] += 1
+                s[1] += seconds
+                s[2] = max(s[2], seconds)
+
+    def _sample(self, interval: float) -> None:
+        me = threading.get_ident()
+
+        while not self._stop.wait(interval):
+            stacks = []
+            for ident, frame in sys._current_frames().items():
+                if ident == me:
+                    continue
+
+                stack = []
+                while frame is not None and len(stack) < self.max_depth:
+                    code = frame.f_code
+                    stack.append(f'{code.co_name} ({code.co_filename}:{frame.f_lineno})')
+                    frame = frame.f_back
+
+                stacks.append(';'.join(reversed(stack)))
+
+            with self._lock:
+                self._samples.update(stacks)
+
+    def start(self, sampling: bool = False, interval: float = 0.01) -> None:
+        """Reset the results and start profiling.
+
+        :param sampling: also sample the stacks of all threads
+        :param interval: seconds between samples, at least MIN_SAMPLE_INTERVAL
+        """
+        if not interval >= MIN_SAMPLE_INTERVAL:
+            raise ValueError(f'Interval must be at least {MIN_SAMPLE_INTERVAL} sec.')
+
+        self.stop()
+
+        with self._lock:
+            self._stages.clear()
+            self._samples.clear()
+
+        self.since = time.time()
+        self.enabled = True
+
+        if sampling:
+            self._stop.clear()
+            self._sampler = threading.Thread(target=self._sample, args=(interval, ), daemon=True)
+            self._sampler.start()
+
+    def stop(self) -> None:
+        self.enabled = False
+
+        if self._sampler is not None:
+            self._stop.set()
+            self._sampler.join()
+            self._sampler = None
+
+    def summary(self, top: int = 50) -> Dict:
+        """Profiling results, stacks use the collapsed format of flame graph tools.
+
+        :param top: number of most sampled stacks returned
+        """
+        with self._lock:
+            stages = {
+                k: {'Count': c, 'Total': t, 'Mean': t / c, 'Max': m}
+                for k, (c, t, m) in sorted(self._stages.items())
+            }
+            samples = [{'Stack': k, 'Count': v} for k, v in self._samples.most_common(top)]
+
+        return {
+            'Enabled': self.enabled,
+            'Sampling': self._sampler is not None,
+            'Since': self.since,
+            'Stages': stages,
+            'Samples': samples
+        }
+
+
+class StartupTimer:
+    def __init__(self, start: float = None) -> None:
+        """Record how long each startup stage took to finish.
+
+        :param start: time.perf_counter() value of the process start
+        """
+        self.start = time.perf_counter() if start is None else start
+        self.stages = {}
+
+    def mark(self, stage: str) -> None:
+        # Only the first mark counts, later calls are cheap no-ops.
+        if stage not in self.stages:
+            self.stages[stage] = time.perf_counter() - self.start
+
+    def report(self) -> str:
+        return ' | '.join(f'{k} {v:.3f}s' for k, v in sorted(self.stages.items(), key=lambda i: i[1]))
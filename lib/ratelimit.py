@@ -0,0 +1,79 @@
+import threading
+import time
+from collections import OrderedDict
+from typing import Any
+
+
+class TokenBucket:
+    def __init__(self, rate: float, burst: float) -> None:
+        """Token bucket rate limiter, not thread safe on its own.
+
+        :param rate: tokens added per second
+        :param burst: bucket capacity
+        """
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.stamp = time.monotonic()
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        self.tokens = min(self.burst, self.tokens + (now - self.stamp) * self.rate)
+        self.stamp = now
+
+    def consume(self, tokens: float = 1.) -> bool:
+        self._refill()
+
+        if self.tokens >= tokens:
+            self.tokens -= tokens
+            return True
+
+        return False
+
+    def retry_after(self, tokens: float = 1.) -> float:
+        """Seconds until the given number of tokens is available."""
+        self._refill()
+
+        if self.tokens >= tokens or self.rate <= 0:
+            return 0.
+
+        return (tokens - self.tokens) / self.rate
+
+
+class KeyedRateLimiter:
+    def __init__(self, max_keys: int = 1024) -> None:
+        """Thread safe token buckets per key, least recently used keys are forgotten.
+
+        :param max_keys: number of keys remembered
+        """
+        self.max_keys = max_keys
+
+        self._buckets = OrderedDict()
+        self._lock = threading.Lock()
+
+    def acquire(self, key: Any, rate: float, burst: float) -> float:
+        """Take one token from the bucket of a key.
+
+        :param key: rate limited key
+        :param rate: tokens added per second
+        :param burst: bucket capacity
+        :return: 0 when allowed, otherwise seconds to wait before retrying
+        """
+        with self._lock:
+            bucket = self._buckets.get(key)
+
+            if bucket is None:
+                if len(self._buckets) >= self.max_keys:
+                    self._buckets.popitem(last=False)
+
+                bucket = self._buckets[key] = TokenBucket(rate, burst)
+
+            else:
+                self._buckets.move_to_end(key)
+                bucket.rate = rate
+                bucket.burst = burst
+
+            if bucket.consume():
+                return 0.
+
+            return bucket.retry_after()
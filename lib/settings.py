@@ -1,11 +1,36 @@
 import pathlib
+import queue
 import threading
 
+from lib.capture import TrafficCapture
+from lib.db import CircuitBreaker, RecentKeys
+from lib.events import EventBus
+from lib.liveness import EdgeRegistry
+from lib.metrics import Metrics
+from lib.profiling import Profiler, StartupTimer
+from lib.ratelimit import KeyedRateLimiter
+from lib.spool import RecordSpool
+from lib.timesync import TimeSync
+
 
 cfgPath = pathlib.Path('./config.ini')
 tmpPath = pathlib.Path('./ModifyMeToClose.tmp')
 closeEvent = threading.Event()
-lock_edges = threading.Lock()
 lock_ser = threading.Lock()
-edges = {}
 ser_edges = []
+ser_devices = {}
+ser_outbox = queue.Queue()
+ser_mux_running = threading.Event()
+event_bus = EventBus()
+edges = EdgeRegistry(event_bus)
+metrics = Metrics()
+startup_timer = StartupTimer()
+device_limiter = KeyedRateLimiter()
+profiler = Profiler()
+capture = TrafficCapture()
+recent_records = RecentKeys()
+db_breaker = CircuitBreaker()
+spool = RecordSpool()
+time_sync = TimeSync()
+# Last edge params read from MySQL per DeviceSN, served while MySQL is unavailable.
+edge_params = {}
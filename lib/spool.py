@@ -0,0 +1,72 @@
+import json
+import os
+import pathlib
+import threading
+from datetime import datetime
+from os import PathLike
+from typing import Iterator, Tuple
+
+
+class RecordSpool:
+    def __init__(self) -> None:
+        """Durable local file of sensor records accepted while MySQL was unavailable."""
+        self.path = None
+
+        self._lock = threading.Lock()
+
+    @property
+    def enabled(self) -> bool:
+        return self.path is not None
+
+    @property
+    def replay_path(self) -> pathlib.Path:
+        return self.path.with_name(self.path.name + '.replay')
+
+    def open(self, path: str | PathLike[str]) -> None:
+        self.path = pathlib.Path(path)
+
+    def append(self, data_record: Tuple) -> None:
+        """Store one record, it is on disk when this returns.
+
+        :param data_record: parameters of the SensorRecords insert statement
+        """
+        line = [*data_record[:13], data_record[13].timestamp(), data_record[14]]
+        line = json.dumps(line) + '\n'
+
+        with self._lock:
+            with open(self.path, 'a', encoding='utf-8') as f:
+                f.write(line)
+                f.flush()
+                os.fsync(f.fileno())
+
+    def pending(self) -> bool:
+        return self.enabled and (self.path.is_file() or self.replay_path.is_file())
+
+    def take(self) -> Iterator[Tuple]:
+        """Read the spooled records, new records keep going to a fresh file meanwhile.
+
+        The records stay in the replay file until done() is called, so an interrupted
+        replay is repeated, which the insert statement ignores for rows already stored.
+
+        :return: parameters of the SensorRecords insert statement
+        """
+        with self._lock:
+            if not self.replay_path.is_file() and self.path.is_file():
+                os.replace(self.path, self.replay_path)
+
+        if not self.replay_path.is_file():
+            return
+
+        with open(self.replay_path, 'r', encoding='utf-8') as f:
+            for line in f:
+                try:
+                    line = json.loads(line)
+
+                except ValueError:
+                    # Torn last line of a crash while appending.
+                    continue
+
+                yield (*line[:13], datetime.fromtimestamp(line[13]), line[14])
+
+    def done(self) -> None:
+        self.replay_path.unlink(missing_ok=True)
@@ -2,26 +2,35 @@ import csv
 import logging
 import time
 from configparser import ConfigParser
-from typing import Tuple, Dict, Any
+from typing import Tuple, Dict, List, Any, Callable
 
 import adafruit_ads1x15.ads1115 as ads1115
 import board
 import busio
 import digitalio
-import mysql.connector
 from adafruit_ads1x15.analog_in import AnalogIn
 from adafruit_bme280 import basic as adafruit_bme280
 
-from lib.settings import closeEvent
+from lib.codec import sensor_record_to_dict
+from lib.db import (
+    DB_UNAVAILABLE_ERRORS, INSERT_SENSOR_RECORD, LazyConnectionPool, StatementCache, get_db_connection,
+    report_db_failure
+)
+from lib.events import EVENT_SENSOR_RECORD
+from lib.settings import closeEvent, event_bus, startup_timer, db_breaker, metrics
 from lib.utils import check_time_to_wake_up, key2head
 
 
 def run_swps_local_sys(
     cfg: ConfigParser,
-    cnx: mysql.connector.pooling.PooledMySQLConnection,
+    cnxpool: LazyConnectionPool,
     logger_parent: logging.Logger = None
 ) -> None:
-    local_sys = SmartWaterPumpSystem(cfg, cnx, logger_parent)
+    local_sys = SmartWaterPumpSystem(cfg, cnxpool, logger_parent)
+
+    startup_timer.mark('i2c')
+    if logger_parent:
+        logger_parent.info(f'Startup timing: {startup_timer.report()}')
 
     bme_check = hasattr(local_sys.sensor, 'bme280')
     ads_check = hasattr(local_sys.sensor, 'ads')
@@ -39,13 +48,13 @@ class SmartWaterPumpSystem:
     def __init__(
             self,
             cfg: ConfigParser,
-            cnx: mysql.connector.pooling.PooledMySQLConnection,
+            cnxpool: LazyConnectionPool,
             logger_parent: logging.Logger = None
     ) -> None:
         """Local system to drive water pump.
 
         :param cfg: system setting
-        :param cnx: mysql connection
+        :param cnxpool: mysql connection pool, a connection is taken once MySQL is reachable
         :param logger_parent: to get parent logger information
         """
         if logger_parent:
@@ -59,23 +68,29 @@ class SmartWaterPumpSystem:
         self.run_lock = False
 
         self.cfg = cfg
-        self.cnx = cnx
+        self.cnxpool = cnxpool
+        self.cnx = None
+        self.stmts = None
         self.csvPath = cfg['Local']['csv_path']
 
         self.sensor = SensorAssembly(self.logger)
         self.pump = WaterPumpAssembly(board.D23, self.logger)
 
+    def _db_ready(self) -> bool:
+        if not db_breaker.allow():
+            return False
+
+        if self.cnx is None:
+            self.cnx = get_db_connection(self.cnxpool, db_breaker, metrics, self.logger)
+
+            if self.cnx is not None:
+                self.stmts = StatementCache(self.cnx)
+
+        return self.cnx is not None
+
     def _upload_data_mysql(self, **kwargs) -> None:
         kwargs = key2head(kwargs)
 
-        cursor = self.cnx.cursor()
-
-        add_record = ("INSERT INTO SensorRecords "
-                      "(UserID, DeviceId, Temperature, Humidity, Pressure, RawValue0, RawValue1, RawValue2, "
-                      "RawValue3, Voltage0, Voltage1, Voltage2, Voltage3, DetectTime, PumpStartTime) "
-                      "VALUES ((SELECT UserId FROM EdgeDevices WHERE DeviceSN = %s), "
-                      "(SELECT Id FROM EdgeDevices WHERE DeviceSN = %s), "
-                      "%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)")
         data_record = (
             self.cfg['Default']['device_sn'],
             self.cfg['Default']['device_sn'],
@@ -93,10 +108,22 @@ class SmartWaterPumpSystem:
             kwargs['DetectTime'],
             kwargs['PumpStartTime']
         )
-        cursor.execute(add_record, data_record)
+        # Fail at once while MySQL is known to be down, the record goes to the local file.
+        if not self._db_ready():
+            raise ConnectionError('MySQL is unavailable')
 
-        self.cnx.commit()
-        cursor.close()
+        try:
+            self.stmts.execute(INSERT_SENSOR_RECORD, data_record)
+
+            self.cnx.commit()
+
+        except DB_UNAVAILABLE_ERRORS as err:
+            report_db_failure(err, db_breaker, metrics, self.logger)
+            raise
+
+        db_breaker.record_success()
+
+        event_bus.publish(EVENT_SENSOR_RECORD, sensor_record_to_dict(data_record))
 
     def _write_data_local(self, **kwargs) -> None:
         head = [
@@ -197,17 +224,21 @@ class SmartWaterPumpSystem:
             self.run_lock = False
 
     def close(self) -> None:
-        self.cnx.close()
+        if self.cnx is not None:
+            self.stmts.close()
+            self.cnx.close()
 
 
 class SensorAssembly:
     def __init__(
             self,
-            logger_parent: logging.Logger = None
+            logger_parent: logging.Logger = None,
+            probe_timeout: float = 2.
     ) -> None:
         """Contain BME280 atmospheric sensor and ADS1115 ADC.
 
         :param logger_parent: to get parent logger information
+        :param probe_timeout: maximum time to wait for the devices to answer
         """
         if logger_parent:
             self.logger = logging.getLogger(
@@ -219,39 +250,72 @@ class SensorAssembly:
 
         self.i2c = busio.I2C(board.SCL, board.SDA)
 
-        if self.i2c.try_lock():
-            i2c_address = self.i2c.scan()
+        i2c_address = self._scan(probe_timeout)
 
-        else:
-            i2c_address = []
+        self.logger.info(f'I2C addresses found: {[hex(i) for i in i2c_address]}')
 
-        self.i2c.unlock()
+        ads_address = [i for i in i2c_address if 0x48 <= i <= 0x4B]
+        bme_address = [i for i in i2c_address if 0x76 <= i <= 0x77]
 
-        time.sleep(2)
+        # One bus, probed one device after the other, busio locks are not thread safe.
+        ads = self._probe(
+            'ads1115',
+            lambda i: ads1115.ADS1115(address=i, i2c=self.i2c),
+            ads_address,
+            probe_timeout
+        )
+        if ads is not None:
+            self.ads = ads
+
+        bme = self._probe(
+            'bme280',
+            lambda i: adafruit_bme280.Adafruit_BME280_I2C(self.i2c, i),
+            bme_address,
+            probe_timeout
+        )
+        if bme is not None:
+            self.bme280 = bme
 
-        self.logger.info(f'I2C addresses found: {[hex(i) for i in i2c_address]}')
+    def _scan(self, timeout: float) -> List[int]:
+        # Poll until both devices answer instead of waiting a fixed delay.
+        deadline = time.monotonic() + timeout
+        i2c_address = []
 
-        for i in i2c_address:
-            if 0x48 <= i <= 0x4B:
-                try:
-                    self.ads = ads1115.ADS1115(address=i, i2c=self.i2c)
-                    self.logger.info(f'Success to initialize device(ads1115 {hex(i)})!')
-                    break
+        while True:
+            if self.i2c.try_lock():
+                i2c_address = self.i2c.scan()
+                self.i2c.unlock()
 
-                except BaseException as err:
-                    self.logger.warning(
-                        f'Failed to initialize local device(ads1115 {hex(i)})! Error: {err!r}'
-                    )
+            ads_found = any(0x48 <= i <= 0x4B for i in i2c_address)
+            bme_found = any(0x76 <= i <= 0x77 for i in i2c_address)
 
-            elif 0x76 <= i <= 0x77:
+            if (ads_found and bme_found) or time.monotonic() >= deadline:
+                return i2c_address
+
+            time.sleep(0.05)
+
+    def _probe(self, name: str, init: Callable[[int], Any], addresses: List[int], timeout: float) -> Any:
+        deadline = time.monotonic() + timeout
+
+        while addresses:
+            for i in addresses:
                 try:
-                    self.bme280 = adafruit_bme280.Adafruit_BME280_I2C(self.i2c, i)
-                    self.logger.info(f'Success to initialize device(bme280 {hex(i)})!')
+                    device = init(i)
+                    self.logger.info(f'Success to initialize device({name} {hex(i)})!')
+                    return device
 
                 except BaseException as err:
-                    self.logger.warning(
-                        f'Failed to initialize local device(bme280 {hex(i)})! Error: {err!r}'
-                    )
+                    if time.monotonic() >= deadline:
+                        self.logger.warning(
+                            f'Failed to initialize local device({name} {hex(i)})! Error: {err!r}'
+                        )
+
+            if time.monotonic() >= deadline:
+                break
+
+            time.sleep(0.05)
+
+        return None
 
     def detect_atmospheric_data(self) -> Tuple[float, float, float]:
         try:
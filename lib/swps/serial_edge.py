@@ -0,0 +1,294 @@
+import json
+import logging
+import queue
+import selectors
+import time
+from configparser import ConfigParser
+from typing import Dict
+
+import mysql.connector
+import serial
+
+from lib.capture import DIR_IN, DIR_OUT, DIR_CLOSE
+from lib.codec import ENCODING_JSON
+from lib.settings import (
+    closeEvent, lock_ser, ser_edges, ser_devices, ser_outbox, ser_mux_running, capture, edges, db_breaker, metrics
+)
+from lib.db import LazyConnectionPool, StatementCache, get_db_connection
+from lib.swps.server import SmartWaterPumpMiddleware
+from lib.utils import create_data_dict
+
+
+EDGE_APIS = ('setup_edge', 'set_params', 'upload_sensor_record', 'sync_time')
+# Boards miss the first request while they boot after the USB reset, it is repeated until answered.
+PROBE_INTERVAL = 2.
+
+
+def run_serial_edges(
+    cfg: ConfigParser,
+    cnxpool: LazyConnectionPool,
+    logger_parent: logging.Logger = None
+) -> None:
+    mux = SerialEdgeMultiplexer(cfg, cnxpool, logger_parent)
+
+    ser_mux_running.set()
+
+    try:
+        while not closeEvent.is_set():
+            mux.run()
+
+    finally:
+        ser_mux_running.clear()
+        mux.close()
+
+
+class SerialEdgeMiddleware(SmartWaterPumpMiddleware):
+    def __init__(
+        self,
+        port: serial.Serial,
+        cfg: ConfigParser,
+        cnx: mysql.connector.pooling.PooledMySQLConnection | None,
+        logger_parent: logging.Logger = None
+    ) -> None:
+        """Edge protocol over a serial port, the connection is shared with the other ports.
+
+        :param port: opened serial port
+        :param cfg: system setting
+        :param cnx: mysql connection shared by the multiplexer, None while MySQL is unavailable
+        :param logger_parent: to get parent logger information
+        """
+        super().__init__(port, (port.port, 'serial'), cfg, cnx, logger_parent)
+
+    def _expire(self) -> None:
+        self.logger.warning(f'Serial device {self.address[0]} ({self.device_sn}) timed out, closing session.')
+        self.keep_server = False
+
+    def _setup_edge(self, data: Dict) -> Dict:
+        # Serial messages are framed by lines, binary struct frames cannot be used.
+        data = dict(data)
+        if 'Encoding' in data:
+            data['Encoding'] = ENCODING_JSON
+
+        return super()._setup_edge(data)
+
+    def close(self) -> None:
+        # The port and the shared mysql connection belong to the multiplexer.
+        self.stmts.close()
+        capture.record(self.capture_id, DIR_CLOSE)
+        edges.close_session(self.session)
+
+
+class SerialEdgeMultiplexer:
+    def __init__(
+        self,
+        cfg: ConfigParser,
+        cnxpool: LazyConnectionPool,
+        logger_parent: logging.Logger = None
+    ) -> None:
+        """Serve every serial attached edge from one thread with a selector.
+
+        :param cfg: system setting
+        :param cnxpool: mysql connection pool, one connection is shared by all serial edges
+        :param logger_parent: to get parent logger information
+        """
+        if logger_parent:
+            self.logger = logging.getLogger(
+                logger_parent.name + '.' + self.__class__.__name__
+            )
+
+        else:
+            self.logger = logging.getLogger(self.__class__.__name__)
+
+        self.cfg = cfg
+        self.cnxpool = cnxpool
+        self.cnx = None
+        self.timeout = float(cfg['Default']['server_timeout(sec.)'])
+        self.max_bufsize = int(cfg['Default']['max_bufsize'])
+        self.encoding = cfg['Default']['sys_encoding']
+
+        self.selector = selectors.DefaultSelector()
+        self.ports = {}
+
+    def _open(self, name: str) -> None:
+        ser = serial.Serial()
+        ser.baudrate = 115200
+        ser.port = name
+        ser.timeout = 0
+        ser.write_timeout = 1
+
+        try:
+            ser.open()
+
+        except BaseException as err:
+            self.logger.warning(f'Failed to open serial port {name}! Error: {err!r}', extra={'rate_key': 'serial_open'})
+            return
+
+        self.ports[name] = {
+            'serial': ser,
+            'buffer': bytearray(),
+            'middleware': None,
+            'device_sn': None,
+            'probed': 0.
+        }
+        self.selector.register(ser.fileno(), selectors.EVENT_READ, name)
+
+    def _probe_ports(self) -> None:
+        now = time.monotonic()
+
+        for name in [n for n, p in self.ports.items() if p['device_sn'] is None]:
+            if now - self.ports[name]['probed'] >= PROBE_INTERVAL:
+                self.ports[name]['probed'] = now
+                self._write(name, json.dumps(create_data_dict('get_device_sn', False, {})).encode(self.encoding))
+
+    def _set_device_sn(self, name: str, device_sn: str) -> None:
+        self.ports[name]['device_sn'] = device_sn
+
+        lock_ser.acquire()
+        ser_devices[name] = device_sn
+        lock_ser.release()
+
+    def _close(self, name: str) -> None:
+        port = self.ports.pop(name)
+
+        try:
+            self.selector.unregister(port['serial'].fileno())
+
+        except (KeyError, ValueError, OSError):
+            pass
+
+        if port['middleware'] is not None:
+            port['middleware'].close()
+
+        port['serial'].close()
+
+        lock_ser.acquire()
+        ser_devices.pop(name, None)
+        lock_ser.release()
+
+    def _sync_ports(self) -> None:
+        lock_ser.acquire()
+        ports = ser_edges[:]
+        lock_ser.release()
+
+        for name in [p for p in self.ports if p not in ports]:
+            self._close(name)
+
+        for name in [p for p in ports if p not in self.ports]:
+            self._open(name)
+
+    def _write(self, name: str, data: bytes) -> bool:
+        try:
+            self.ports[name]['serial'].write(data + b'\n')
+
+        except BaseException as err:
+            self.logger.warning(f'Failed to write serial port {name}! Error: {err!r}', extra={'rate_key': 'serial_write'})
+            self._close(name)
+            return False
+
+        return True
+
+    def _handle_line(self, name: str, line: bytes) -> None:
+        try:
+            msg = json.loads(line.decode(self.encoding))
+            api = msg.get('Api')
+
+        except BaseException as err:
+            self.logger.warning(f'Received invalid line from serial port {name}! Error: {err!r}',
+                                extra={'rate_key': 'serial_invalid'})
+            return
+
+        port = self.ports[name]
+
+        if api not in EDGE_APIS:
+            # Reply to get_device_sn.
+            if msg.get('Result') and isinstance(msg.get('Data'), dict) and 'DeviceSN' in msg['Data']:
+                self._set_device_sn(name, msg['Data']['DeviceSN'])
+
+            return
+
+        if self.cnx is None:
+            self.cnx = get_db_connection(self.cnxpool, db_breaker, metrics, self.logger)
+
+        mw = port['middleware']
+        if mw is not None and mw.cnx is None and self.cnx is not None:
+            mw.cnx = self.cnx
+            mw.stmts = StatementCache(self.cnx)
+
+        if mw is None or not mw.keep_server:
+            if mw is not None:
+                mw.close()
+
+            mw = port['middleware'] = SerialEdgeMiddleware(port['serial'], self.cfg, self.cnx, self.logger)
+
+        capture.record(mw.capture_id, DIR_IN, line)
+        data = mw.handle(line)
+        capture.record(mw.capture_id, DIR_OUT, data)
+
+        if api == 'setup_edge' and mw.device_sn:
+            self._set_device_sn(name, mw.device_sn)
+
+        self._write(name, data)
+
+    def _read(self, name: str) -> None:
+        port = self.ports[name]
+        ser = port['serial']
+
+        try:
+            data = ser.read(ser.in_waiting or 1)
+
+        except BaseException as err:
+            self.logger.warning(f'Failed to read serial port {name}! Error: {err!r}', extra={'rate_key': 'serial_read'})
+            self._close(name)
+            return
+
+        buf = port['buffer']
+        buf += data
+
+        while name in self.ports:
+            i = buf.find(b'\n')
+            if i < 0:
+                break
+
+            line = bytes(buf[:i]).strip()
+            del buf[:i + 1]
+
+            if line:
+                self._handle_line(name, line)
+
+        if len(buf) > self.max_bufsize:
+            self.logger.warning(f'Serial port {name} sent an over-long line, discarded.')
+            buf.clear()
+
+    def run(self) -> None:
+        self._sync_ports()
+        self._probe_ports()
+
+        while True:
+            try:
+                data, written = ser_outbox.get_nowait()
+
+            except queue.Empty:
+                break
+
+            result = True
+            for name in list(self.ports):
+                result = self._write(name, data) and result
+
+            written.put(result)
+
+        if not self.ports:
+            closeEvent.wait(self.timeout)
+            return
+
+        for key, _ in self.selector.select(timeout=1):
+            if key.data in self.ports:
+                self._read(key.data)
+
+    def close(self) -> None:
+        for name in list(self.ports):
+            self._close(name)
+
+        self.selector.close()
+
+        if self.cnx is not None:
+            self.cnx.close()
@@ -1,19 +1,42 @@
+import configparser
 import json
 import logging
+import multiprocessing
 import queue
 import socket
 import threading
 import time
 from configparser import ConfigParser
 from datetime import datetime
-from typing import Tuple, Dict
+from typing import Tuple, Dict, Any
 
 import mysql.connector
 import serial
 from serial.tools import list_ports
 
-from lib.settings import closeEvent, lock_edges, lock_ser, edges, ser_edges
-from lib.utils import key2head, create_data_dict
+from lib.capture import DIR_IN, DIR_OUT, DIR_CLOSE
+from lib.codec import (
+    ENCODING_JSON, ENCODING_STRUCT, negotiate_encoding, is_struct_frame, decode_sensor_record,
+    sensor_record_from_dict, sensor_record_to_dict, encode_ack, encode_replies, encode_retry_after
+)
+from lib.db import (
+    DB_UNAVAILABLE_ERRORS, INSERT_SENSOR_RECORD, SELECT_EDGE_PARAMS, SELECT_SENSOR_RECORDS_FIRST,
+    SELECT_SENSOR_RECORDS_NEXT, SENSOR_RECORD_COLUMNS, LazyConnectionPool, StatementCache, get_db_connection,
+    report_db_failure
+)
+from lib.events import EVENT_SENSOR_RECORD, EVENT_SERIAL_STATUS, parse_events
+from lib.logs import setup_worker_logger
+from lib.settings import (
+    cfgPath, closeEvent, lock_ser, edges, ser_edges, event_bus, metrics, startup_timer,
+    device_limiter, profiler, capture, recent_records, ser_devices, ser_outbox, ser_mux_running,
+    db_breaker, spool, time_sync, edge_params
+)
+from lib.utils import create_data_dict, set_tcp_keepalive
+
+
+RATE_LIMITED_APIS = ('set_params', 'upload_sensor_record')
+# After value of get_sensor_records pages that only carry a DetectTime.
+MAX_RECORD_ID = 2 ** 63 - 1
 
 
 def listen_serial_port(
@@ -24,9 +47,104 @@ def listen_serial_port(
         ports = [i.device for i in ports if cfg['Edge']['arduino_uno_r4_wifi'] in i.hwid]
 
         lock_ser.acquire()
+        attached = [p for p in ports if p not in ser_edges]
+        detached = [p for p in ser_edges if p not in ports]
         ser_edges[:] = ports[:].copy()
         lock_ser.release()
 
+        for p in attached:
+            event_bus.publish(EVENT_SERIAL_STATUS, {'Port': p, 'Status': True}, EVENT_SERIAL_STATUS + p)
+
+        for p in detached:
+            event_bus.publish(EVENT_SERIAL_STATUS, {'Port': p, 'Status': False}, EVENT_SERIAL_STATUS + p)
+
+        closeEvent.wait(1)
+
+
+def watch_edge_liveness() -> None:
+    while not closeEvent.wait(edges.tick):
+        edges.advance()
+
+
+def replay_spool(cnx: mysql.connector.MySQLConnection, logger: logging.Logger) -> None:
+    stmts = StatementCache(cnx)
+    count = 0
+
+    try:
+        for data_record in spool.take():
+            try:
+                stmts.execute(INSERT_SENSOR_RECORD, data_record)
+
+            except DB_UNAVAILABLE_ERRORS:
+                raise
+
+            except mysql.connector.errors.Error as err:
+                logger.warning(
+                    f'Dropped spooled record of {data_record[0]}! Error: {err!r}',
+                    extra={'rate_key': 'spool_dropped'}
+                )
+                continue
+
+            count += 1
+            if count % 500 == 0:
+                cnx.commit()
+
+        cnx.commit()
+        spool.done()
+
+    except DB_UNAVAILABLE_ERRORS as err:
+        report_db_failure(err, db_breaker, metrics, logger)
+        return
+
+    finally:
+        stmts.close()
+
+    metrics.inc('replayed_records', count)
+    logger.info(f'Replayed {count} spooled sensor records to MySQL.')
+
+
+def watch_database(
+    cfg: ConfigParser,
+    logger_parent: logging.Logger = None
+) -> None:
+    """Probe MySQL while the circuit breaker is open, replay the spool once it is reachable.
+
+    :param cfg: system setting
+    :param logger_parent: to get parent logger information
+    """
+    logger = logging.getLogger(logger_parent.name + '.DatabaseWatcher' if logger_parent else 'DatabaseWatcher')
+
+    while not closeEvent.wait(edges.tick):
+        if db_breaker.allow():
+            if not spool.pending():
+                continue
+
+        elif not db_breaker.probe_due():
+            continue
+
+        try:
+            cnx = mysql.connector.connect(
+                host=cfg['SQL']['host'],
+                port=int(cfg['SQL']['port']),
+                user=cfg['SQL']['user'],
+                password=cfg['SQL']['password'],
+                database=cfg['SQL']['database'],
+                connection_timeout=int(cfg['Default']['db_connect_timeout(sec.)'])
+            )
+
+        except mysql.connector.errors.Error as err:
+            report_db_failure(err, db_breaker, metrics, logger)
+            continue
+
+        if db_breaker.record_success():
+            logger.info('MySQL is reachable again, circuit breaker closed.')
+
+        try:
+            replay_spool(cnx, logger)
+
+        finally:
+            cnx.close()
+
 
 def listen_edge_clients(
     cfg: ConfigParser,
@@ -40,7 +158,8 @@ def listen_edge_clients(
         int(cfg['Default']['max_client_devices']),
         float(cfg['Default']['server_timeout(sec.)']),
         True,
-        logger_parent
+        logger_parent,
+        sys_encoding=cfg['Default']['sys_encoding']
     )
 
     while not closeEvent.is_set():
@@ -49,6 +168,119 @@ def listen_edge_clients(
     server_sys.close()
 
 
+def run_edge_worker(
+    worker_id: int,
+    ipc_q: multiprocessing.Queue,
+    log_q: multiprocessing.Queue,
+    stop_event: Any
+) -> None:
+    """Edge listener process, binds the shared edge port with SO_REUSEPORT.
+
+    :param worker_id: worker number
+    :param ipc_q: edge status, metrics and events sent to the main process
+    :param log_q: log records sent to the main process
+    :param stop_event: multiprocessing event set by the main process to stop
+    """
+    cfg = configparser.ConfigParser()
+    cfg.read(cfgPath, encoding='utf-8')
+
+    logger = setup_worker_logger(log_q, f'root.EdgeWorker{worker_id}')
+
+    edges.track_dirty = True
+
+    if cfg['Default']['capture_path']:
+        capture.open(f"{cfg['Default']['capture_path']}.{worker_id}", int(cfg['Default']['capture_max_bytes']))
+
+    if cfg['Default']['spool_path']:
+        spool.open(f"{cfg['Default']['spool_path']}.{worker_id}")
+
+    db_breaker.failure_threshold = int(cfg['Default']['db_failure_threshold'])
+    db_breaker.reset_timeout = float(cfg['Default']['db_retry_interval(sec.)'])
+
+    cnxpool = LazyConnectionPool(
+        pool_name=f'swps_sql_pool_{worker_id}',
+        pool_size=int(cfg['Default']['max_client_devices']),
+        host=cfg['SQL']['host'],
+        port=int(cfg['SQL']['port']),
+        user=cfg['SQL']['user'],
+        password=cfg['SQL']['password'],
+        database=cfg['SQL']['database'],
+        connection_timeout=int(cfg['Default']['db_connect_timeout(sec.)'])
+    )
+
+    server_sys = SmartWaterPumpServer(
+        cfg['Default']['server_ip'],
+        int(cfg['Default']['server_port']),
+        int(cfg['Default']['max_client_devices']),
+        float(cfg['Default']['server_timeout(sec.)']),
+        True,
+        logger,
+        reuse_port=True,
+        sys_encoding=cfg['Default']['sys_encoding']
+    )
+
+    def wait_for_stop() -> None:
+        stop_event.wait()
+        closeEvent.set()
+
+    for target, args in (
+        (wait_for_stop, ()),
+        (watch_edge_liveness, ()),
+        (watch_database, (cfg, logger)),
+        (sync_edge_worker, (ipc_q, ))
+    ):
+        t = threading.Thread(target=target, args=args, daemon=True)
+        t.start()
+
+    logger.info(f'Edge worker {worker_id} started.')
+
+    q = queue.Queue()
+    l = threading.Lock()
+    while not closeEvent.is_set():
+        server_sys.run(q, l)
+
+        while not q.empty():
+            client, addr, _ = q.get()
+            t = threading.Thread(
+                target=handle_edge_sys,
+                args=(client, addr, cfg, cnxpool, logger)
+            )
+            t.start()
+
+    server_sys.close()
+    capture.close()
+
+
+def sync_edge_worker(ipc_q: multiprocessing.Queue) -> None:
+    # Sensor records are forwarded as events, edge status is rebuilt from the registry records.
+    sub = event_bus.subscribe((EVENT_SENSOR_RECORD, ), 1000)
+
+    while not closeEvent.wait(edges.tick):
+        data = {
+            'Edges': edges.drain_dirty(),
+            'Metrics': metrics.drain(),
+            'Events': sub.get(0)
+        }
+
+        if any(data.values()):
+            ipc_q.put(data)
+
+
+def collect_edge_workers(ipc_q: multiprocessing.Queue) -> None:
+    while not closeEvent.is_set():
+        try:
+            data = ipc_q.get(timeout=edges.tick)
+
+        except queue.Empty:
+            continue
+
+        edges.merge(data['Edges'])
+        metrics.merge(data['Metrics'])
+
+        for e in data['Events']:
+            event_bus.publish(e['Event'], e['Data'])
+
+
 def listen_web_clients(
     cfg: ConfigParser,
     q: queue.Queue,
@@ -74,24 +306,30 @@ def handle_edge_sys(
     client: socket.socket,
     address: Tuple,
     cfg: ConfigParser,
-    cnx: mysql.connector.pooling.PooledMySQLConnection,
+    cnxpool: LazyConnectionPool,
     logger_parent: logging.Logger = None
 ) -> None:
-    server_sys = SmartWaterPumpMiddleware(client, address, cfg, cnx, logger_parent)
+    try:
+        server_sys = SmartWaterPumpMiddleware(client, address, cfg, None, logger_parent, cnxpool)
 
-    while (not closeEvent.is_set()) and server_sys.keep_server:
-        server_sys.run()
+        while (not closeEvent.is_set()) and server_sys.keep_server:
+            server_sys.run()
 
-    server_sys.close()
+        server_sys.close()
+
+    finally:
+        edges.release_admission()
 
 
 def handle_web_client(
     client: socket.socket,
     address: Tuple,
     cfg: ConfigParser,
+    cnxpool: LazyConnectionPool,
+    query_slots: threading.Semaphore,
     logger_parent: logging.Logger = None
 ) -> None:
-    server_sys = WebClientMiddleware(client, address, cfg, logger_parent)
+    server_sys = WebClientMiddleware(client, address, cfg, cnxpool, query_slots, logger_parent)
 
     server_sys.run()
 
@@ -108,7 +346,9 @@ class SmartWaterPumpServer:
         max_clients_num: int,
         timeout: float,
         is_edge: bool,
-        logger_parent: logging.Logger = None
+        logger_parent: logging.Logger = None,
+        reuse_port: bool = False,
+        sys_encoding: str = 'utf-8'
     ) -> None:
         """Server system to listen client devices.
 
@@ -118,6 +358,8 @@ class SmartWaterPumpServer:
         :param timeout: server timeout
         :param is_edge: client type (device or web)
         :param logger_parent: to get parent logger information
+        :param reuse_port: let several processes bind the same port
+        :param sys_encoding: text encoding of the replies
         """
         if logger_parent:
             self.logger = logging.getLogger(
@@ -128,8 +370,14 @@ class SmartWaterPumpServer:
             self.logger = logging.getLogger(self.__class__.__name__)
 
         self.is_edge = is_edge
+        self.max_clients_num = max_clients_num
+        self.timeout = timeout
+        self.sys_encoding = sys_encoding
 
         self.ss = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        if reuse_port:
+            self.ss.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
+
         self.ss.bind((address, port))
         self.ss.listen(max_clients_num)
         self.ss.settimeout(timeout)
@@ -138,13 +386,43 @@ class SmartWaterPumpServer:
         try:
             client, addr = self.ss.accept()
 
+            if self.is_edge and 'first_accept' not in startup_timer.stages:
+                startup_timer.mark('first_accept')
+                self.logger.info(f'Startup timing: {startup_timer.report()}')
+
+            if self.is_edge and not edges.try_admit(self.max_clients_num):
+                self._reject(client, addr)
+                return
+
             lock_q.acquire()
             q.put((client, addr, self.is_edge))
             lock_q.release()
 
         except BaseException as err:
             client_type = 'client device' if self.is_edge else 'web client'
-            self.logger.debug(f'Failed to handle {client_type}! Error: {err!r}')
+            self.logger.debug(
+                f'Failed to handle {client_type}! Error: {err!r}',
+                extra={'rate_key': 'accept_failed'}
+            )
+
+    def _reject(self, client: socket.socket, addr: Tuple) -> None:
+        metrics.inc('rejected_sessions')
+        self.logger.warning(
+            f'Rejected client device {addr[0]}[{addr[1]}], {edges.admitted} sessions are active!',
+            extra={'rate_key': 'edge_rejected'}
+        )
+
+        data = create_data_dict('', False, {'Error': 'server_busy', 'RetryAfter': self.timeout})
+
+        try:
+            client.settimeout(self.timeout)
+            client.sendall(json.dumps(data).encode(self.sys_encoding))
+            client.shutdown(socket.SHUT_RDWR)
+
+        except OSError:
+            pass
+
+        client.close()
 
     def close(self) -> None:
         self.ss.shutdown(socket.SHUT_RDWR)
@@ -157,16 +435,18 @@ class SmartWaterPumpMiddleware:
         client: socket.socket,
         address: Tuple,
         cfg: ConfigParser,
-        cnx: mysql.connector.pooling.PooledMySQLConnection,
-        logger_parent: logging.Logger = None
+        cnx: mysql.connector.pooling.PooledMySQLConnection | None,
+        logger_parent: logging.Logger = None,
+        cnxpool: LazyConnectionPool = None
     ) -> None:
         """Server system to handle client device communication.
 
         :param client: client device connection
         :param address: client device network information
         :param cfg: system setting
-        :param cnx: mysql connection
+        :param cnx: mysql connection, None to take one from cnxpool when MySQL is first needed
         :param logger_parent: to get parent logger information
+        :param cnxpool: mysql connection pool
         """
         if logger_parent:
             self.logger = logging.getLogger(
@@ -180,123 +460,321 @@ class SmartWaterPumpMiddleware:
         self.address = address
         self.cfg = cfg
         self.cnx = cnx
+        self.cnxpool = cnxpool
+        self.stmts = StatementCache(cnx)
         self.device_sn = ''
+        self.encoding = ENCODING_JSON
+        self.sys_encoding = cfg['Default']['sys_encoding']
+        self.reply_success, self.reply_failure = encode_replies(self.sys_encoding)
+        self.correct_time = bool(int(cfg['Default']['correct_detect_time']))
+        # Messages are received into one buffer per connection and parsed from a view of it.
+        self.buffer = bytearray(int(cfg['Default']['max_bufsize']))
+        self.view = memoryview(self.buffer)
         self.keep_server = True
+        self.capture_id = capture.new_session()
+
+        if isinstance(self.client, socket.socket):
+            set_tcp_keepalive(self.client, float(cfg['Default']['tcp_keepalive(sec.)']))
 
-        self.logger.info(f'Connected by client device {self.address[0]}[{self.address[1]}].')
+        self.session = edges.open_session(
+            self.address,
+            float(cfg['Default']['edge_timeout(min.)']) * 60,
+            self._expire
+        )
+        metrics.inc('edge_sessions')
 
-    def _setup_edge(self, device_sn: str) -> Dict:
-        self.device_sn = device_sn
+        self.logger.info(
+            f'Connected by client device {self.address[0]}[{self.address[1]}].',
+            extra={'rate_key': 'edge_connected'}
+        )
 
-        lock_edges.acquire()
-        edges[device_sn] = True
-        lock_edges.release()
+    def _expire(self) -> None:
+        self.logger.warning(
+            f'Client device {self.address[0]}[{self.address[1]}] ({self.device_sn}) timed out, closing session.'
+        )
+        self.keep_server = False
 
-        data = create_data_dict('', True, {})
+        # Wakes up the blocking recv, the session thread then releases its resources.
+        try:
+            self.client.shutdown(socket.SHUT_RDWR)
+
+        except OSError:
+            pass
+
+    def _setup_edge(self, data: Dict) -> Dict | bytes:
+        self.device_sn = data['DeviceSN']
+
+        edges.bind(self.session, self.device_sn)
+
+        if 'Encoding' in data:
+            self.encoding = negotiate_encoding(data['Encoding'])
+            data = create_data_dict('', True, {'Encoding': self.encoding})
+
+        else:
+            data = self.reply_success
 
         return data
 
+    def _db_ready(self) -> bool:
+        if not db_breaker.allow():
+            return False
+
+        if self.cnx is None and self.cnxpool is not None:
+            self.cnx = get_db_connection(self.cnxpool, db_breaker, metrics, self.logger)
+
+            if self.cnx is not None:
+                self.stmts = StatementCache(self.cnx)
+
+        return self.cnx is not None
+
     def _set_params(self) -> Dict:
-        cursor = self.cnx.cursor(dictionary=True)
+        rows = None
+
+        if self._db_ready():
+            try:
+                with profiler.stage('edge.db_execute'):
+                    cursor = self.stmts.execute(SELECT_EDGE_PARAMS, (self.device_sn, ), dictionary=True)
+                    rows = cursor.fetchall()
+
+                db_breaker.record_success()
+
+            except DB_UNAVAILABLE_ERRORS as err:
+                report_db_failure(err, db_breaker, metrics, self.logger)
+
+        if rows is None:
+            # An outage must not change the irrigation settings, the edge keeps its own or gets the last read.
+            data = edge_params.get(self.device_sn)
 
-        query = ("SELECT DetectInterval, PumpStartTime, SoilMoisture "
-                 "FROM EdgeDevices "
-                 "WHERE DeviceSN = %s")
+            if data is None:
+                return create_data_dict('', False, {'Error': 'database_unavailable'})
 
-        cursor.execute(query, (self.device_sn, ))
+            data = dict(data)
 
-        data = cursor.fetchone()
+        elif rows:
+            data = rows[0]
+            data['PumpStartTime'] = int(data['PumpStartTime'] * 1000)
+            edge_params[self.device_sn] = dict(data)
 
-        if data is None:
+        else:
             data = {
                 'DetectInterval': int(self.cfg['Local']['detect_interval(min.)']),
                 'PumpStartTime': int(float(self.cfg['Local']['pump_start_time(sec.)']) * 1000),
                 'SoilMoisture': int(self.cfg['Local']['keep_soil_moisture'])
             }
-        else:
-            data['PumpStartTime'] = int(data['PumpStartTime'] * 1000)
 
         data['RTCTime'] = time.time()
         data = create_data_dict('', True, data)
 
         return data
 
-    def _upload_sensor_record(self, data: Dict) -> Dict:
-        cursor = self.cnx.cursor()
-
-        add_record = ("INSERT INTO SensorRecords "
-                      "(UserID, DeviceId, Temperature, Humidity, Pressure, RawValue0, RawValue1, RawValue2, "
-                      "RawValue3, Voltage0, Voltage1, Voltage2, Voltage3, DetectTime, PumpStartTime) "
-                      "VALUES ((SELECT UserId FROM EdgeDevices WHERE DeviceSN = %s), "
-                      "(SELECT Id FROM EdgeDevices WHERE DeviceSN = %s), "
-                      "%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)")
-        data_record = (
-            data['DeviceSN'],
-            data['DeviceSN'],
-            data['Temperature'],
-            data['Humidity'],
-            data['Pressure'],
-            data['RawValue0'],
-            data['RawValue1'],
-            data['RawValue2'],
-            data['RawValue3'],
-            data['Voltage0'],
-            data['Voltage1'],
-            data['Voltage2'],
-            data['Voltage3'],
-            datetime.fromtimestamp(data['DetectTime']),
-            data['PumpStartTime'] / 1000
-        )
-        cursor.execute(add_record, data_record)
+    def _sync_time(self, data: Dict, received: float) -> Dict:
+        # No database access, edges can resync their clock as often as they like.
+        if not self.device_sn:
+            raise ValueError('sync_time needs the DeviceSN bound by setup_edge')
 
-        self.cnx.commit()
-        cursor.close()
+        previous = (data['PrevT1'], data['PrevT4']) if data.get('PrevT4') is not None else None
+        replied = time.time()
 
-        data = create_data_dict('', True, {})
+        clock = time_sync.exchange(self.device_sn, data['T1'], received, replied, previous)
+        data = create_data_dict('', True, {'T1': data['T1'], 'T2': received, 'T3': replied, **clock})
 
         return data
 
+    def _is_duplicate(self, data_record: Tuple) -> bool:
+        # Edges retransmit when the ack is lost, (DeviceSN, DetectTime) of the edge clock identifies a record.
+        if (data_record[0], data_record[13]) in recent_records:
+            metrics.inc('duplicate_records')
+            return True
+
+        return False
+
+    def _upload_sensor_record(self, data_record: Tuple) -> bytes:
+        """Store a record that is not a recent duplicate, check _is_duplicate first."""
+        key = (data_record[0], data_record[13])
+
+        # Retransmits are corrected by the same offset, so the unique index still recognizes them.
+        if self.correct_time:
+            data_record = (*data_record[:13], time_sync.correct(data_record[0], data_record[13]), data_record[14])
+
+        spooled = not self._db_ready()
+        stored = 1
+
+        if not spooled:
+            try:
+                with profiler.stage('edge.db_execute'):
+                    stored = self.stmts.execute(INSERT_SENSOR_RECORD, data_record).rowcount
+
+                with profiler.stage('edge.commit'):
+                    self.cnx.commit()
+
+                db_breaker.record_success()
+
+            except DB_UNAVAILABLE_ERRORS as err:
+                report_db_failure(err, db_breaker, metrics, self.logger)
+                spooled = True
+
+        # No affected rows, the unique index already holds a retransmit older than recent_records.
+        if not spooled and stored == 0:
+            recent_records.add(key)
+            metrics.inc('duplicate_records')
+
+            return self.reply_success
+
+        if spooled:
+            if not spool.enabled:
+                raise ConnectionError('MySQL is unavailable and spool_path is not set')
+
+            # Accepted once it is on disk, the spool is replayed when MySQL is back.
+            with profiler.stage('edge.spool'):
+                spool.append(data_record)
+
+            metrics.inc('spooled_records')
+
+        recent_records.add(key)
+        metrics.inc('sensor_records')
+        event_bus.publish(EVENT_SENSOR_RECORD, sensor_record_to_dict(data_record))
+
+        return self.reply_success
+
+    def _check_rate(self) -> float:
+        rate = float(self.cfg['Default']['edge_rate_limit(per min.)']) / 60
+        burst = float(self.cfg['Default']['edge_rate_burst'])
+
+        retry_after = device_limiter.acquire(self.device_sn or self.address[0], rate, burst)
+
+        if retry_after:
+            metrics.inc('rate_limited')
+            self.logger.warning(
+                f'Client device {self.device_sn} exceeded its rate limit, retry after {retry_after:.1f}s.',
+                extra={'rate_key': 'edge_rate_limited'}
+            )
+
+        return retry_after
+
+    def _handle_struct_frame(self, data: bytes | memoryview) -> bytes:
+        try:
+            if self.encoding != ENCODING_STRUCT or not self.device_sn:
+                raise ValueError('Struct encoding was not negotiated by setup_edge')
+
+            data_record = decode_sensor_record(data, self.device_sn)
+
+            # Retransmits are acknowledged without using up the rate budget.
+            if not self._is_duplicate(data_record):
+                retry_after = self._check_rate()
+                if retry_after:
+                    return encode_retry_after(retry_after)
+
+                self._upload_sensor_record(data_record)
+
+            result = True
+
+        except BaseException as err:
+            err = f'Unable to handle client device request! Error: {err!r}'
+            self.logger.warning(err)
+            self.keep_server = False
+            result = False
+
+        return encode_ack(result)
+
     def close(self) -> None:
-        self.cnx.close()
-        self.client.shutdown(socket.SHUT_RDWR)
-        self.client.close()
+        self.stmts.close()
 
-        lock_edges.acquire()
-        edges[self.device_sn] = False
-        lock_edges.release()
+        if self.cnx is not None:
+            self.cnx.close()
 
-    def run(self) -> None:
         try:
-            data = self.client.recv(int(self.cfg['Default']['max_bufsize']))
-            data = data.decode(self.cfg['Default']['sys_encoding'])
-            data = json.loads(data)
+            self.client.shutdown(socket.SHUT_RDWR)
+
+        except OSError:
+            pass
+
+        self.client.close()
+
+        capture.record(self.capture_id, DIR_CLOSE)
+        edges.close_session(self.session)
 
+    def handle(self, data: bytes | memoryview) -> bytes:
+        """Handle one edge message, independent of the transport.
+
+        :param data: received message, only valid until the next receive
+        :return: reply to send back
+        """
+        received = time.time()
+        edges.touch(self.session)
+        metrics.inc('edge_messages')
+
+        if is_struct_frame(data):
+            with profiler.stage('edge.dispatch'):
+                return self._handle_struct_frame(data)
+
+        with profiler.stage('edge.decode'):
+            data = json.loads(str(data, self.sys_encoding))
+
+        with profiler.stage('edge.dispatch'):
             try:
-                if data['Api'] == 'setup_edge':
-                    data = self._setup_edge(data['Data']['DeviceSN'])
+                data_record = sensor_record_from_dict(data['Data']) if data['Api'] == 'upload_sensor_record' else None
+
+                # Retransmits are acknowledged without using up the rate budget.
+                duplicate = data_record is not None and self._is_duplicate(data_record)
+                retry_after = self._check_rate() if data['Api'] in RATE_LIMITED_APIS and not duplicate else 0.
+
+                if duplicate:
+                    data = self.reply_success
+
+                elif retry_after:
+                    data = create_data_dict('', False, {'RetryAfter': retry_after})
+
+                elif data['Api'] == 'setup_edge':
+                    data = self._setup_edge(data['Data'])
 
                 elif data['Api'] == 'set_params':
                     data = self._set_params()
 
                 elif data['Api'] == 'upload_sensor_record':
-                    data = self._upload_sensor_record(data['Data'])
+                    data = self._upload_sensor_record(data_record)
+
+                elif data['Api'] == 'sync_time':
+                    data = self._sync_time(data['Data'], received)
 
                 else:
-                    self.logger.warning(f'Received unknown message {data}!')
-                    data = create_data_dict('', False, {})
+                    self.logger.warning(f'Received unknown message {data}!', extra={'rate_key': 'unknown_message'})
+                    data = self.reply_failure
 
             except BaseException as err:
                 err = f'Unable to handle client device request! Error: {err!r}'
-                self.logger.warning(err)
+                self.logger.warning(err, extra={'rate_key': 'edge_request_failed'})
                 self.keep_server = False
-                data = create_data_dict('', False, {})
+                data = self.reply_failure
+
+        if isinstance(data, bytes):
+            return data
+
+        with profiler.stage('edge.encode'):
+            data = json.dumps(data).encode(self.sys_encoding)
+
+        return data
+
+    def run(self) -> None:
+        try:
+            with profiler.stage('edge.recv'):
+                n = self.client.recv_into(self.buffer)
+
+            if not n:
+                raise ConnectionError('Connection closed by peer')
+
+            data = self.view[:n]
+            capture.record(self.capture_id, DIR_IN, data)
+
+            data = self.handle(data)
 
-            data = json.dumps(data).encode(self.cfg['Default']['sys_encoding'])
-            self.client.send(data)
+            with profiler.stage('edge.send'):
+                self.client.send(data)
+
+            capture.record(self.capture_id, DIR_OUT, data)
 
         except BaseException as err:
             err = f'Client Device {self.address[0]}[{self.address[1]}] disconnected unexpectedly! Error: {err!r}'
-            self.logger.warning(err)
+            self.logger.warning(err, extra={'rate_key': 'edge_disconnected'})
             self.keep_server = False
 
 
@@ -306,6 +784,8 @@ class WebClientMiddleware:
             client: socket.socket,
             address: Tuple,
             cfg: ConfigParser,
+            cnxpool: LazyConnectionPool,
+            query_slots: threading.Semaphore,
             logger_parent: logging.Logger = None
     ) -> None:
         """Server system to handle client device communication.
@@ -313,6 +793,8 @@ class WebClientMiddleware:
         :param client: client device connection
         :param address: client device network information
         :param cfg: system setting
+        :param cnxpool: mysql connection pool, used for history queries
+        :param query_slots: limits concurrent history queries to max_web_queries
         :param logger_parent: to get parent logger information
         """
         if logger_parent:
@@ -326,8 +808,13 @@ class WebClientMiddleware:
         self.client = client
         self.address = address
         self.cfg = cfg
+        self.cnxpool = cnxpool
+        self.query_slots = query_slots
 
-        self.logger.info(f'Connected by web client {self.address[0]}[{self.address[1]}].')
+        self.logger.info(
+            f'Connected by web client {self.address[0]}[{self.address[1]}].',
+            extra={'rate_key': 'web_connected'}
+        )
 
     def _get_edges(self) -> Dict:
         data = {
@@ -335,21 +822,28 @@ class WebClientMiddleware:
             'ServerSN': self.cfg['Default']['device_sn'],
             'ServerStatus': True
         }
-        lock_edges.acquire()
-        edges_c = edges.copy()
-        lock_edges.release()
+        edges_c = edges.snapshot()
+        clocks = time_sync.status()
+
+        for c in edges_c:
+            c['Registered'] = False
+            c['Clock'] = clocks.get(c['DeviceSN'])
+            data['Clients'].append(c)
 
-        for k, v in edges_c.items():
-            data['Clients'].append({
-                'DeviceSN': k,
-                'Status': v,
-                'Registered': False
-            })
+        edges_c = {c['DeviceSN'] for c in edges_c}
 
         edges_s = []
         lock_ser.acquire()
 
-        for p in ser_edges:
+        if ser_mux_running.is_set():
+            # The serial multiplexer owns the ports and already asked for their DeviceSN.
+            edges_s = list(ser_devices.values())
+            ports = []
+
+        else:
+            ports = ser_edges
+
+        for p in ports:
             ser = serial.Serial()
             ser.baudrate = 115200
             ser.port = p
@@ -388,22 +882,45 @@ class WebClientMiddleware:
 
         lock_ser.release()
 
-        lock_edges.acquire()
-
         for sn in edges_s:
-            if sn not in edges_c.keys():
+            if sn not in edges_c:
                 data['Clients'].append({
                     'DeviceSN': sn,
                     'Status': True,
                     'Registered': False
                 })
 
-        lock_edges.release()
+        data = create_data_dict('', True, data)
+
+        return data
+
+    @staticmethod
+    def _get_metrics() -> Dict:
+        data = metrics.snapshot()
+        data['db_breaker_state'] = db_breaker.state
 
         data = create_data_dict('', True, data)
 
         return data
 
+    def _set_profiling(self, data: Dict) -> Dict:
+        if data['Enable']:
+            try:
+                profiler.start(bool(data.get('Sampling', False)), float(data.get('Interval', 0.01)))
+
+            except (TypeError, ValueError) as err:
+                return create_data_dict('', False, {'Error': f'Invalid parameters! {err!r}'})
+
+            self.logger.info('Profiling started.')
+
+        else:
+            profiler.stop()
+            self.logger.info('Profiling stopped.')
+
+        data = create_data_dict('', True, profiler.summary())
+
+        return data
+
     def _reset_wifi(self, data: Dict) -> Dict:
         data_ser = {
             'DeviceSN': data['DeviceSN'],
@@ -417,10 +934,20 @@ class WebClientMiddleware:
         data_ser = data_ser.encode(self.cfg['Default']['sys_encoding'])
 
         result = True
+        written = None
 
         lock_ser.acquire()
 
-        for p in ser_edges:
+        if ser_mux_running.is_set():
+            # The serial multiplexer owns the ports, it answers whether every write succeeded.
+            written = queue.Queue(1)
+            ser_outbox.put((data_ser, written))
+            ports = []
+
+        else:
+            ports = ser_edges
+
+        for p in ports:
             ser = serial.Serial()
             ser.baudrate = 115200
             ser.port = p
@@ -443,39 +970,192 @@ class WebClientMiddleware:
 
         lock_ser.release()
 
+        if written is not None:
+            try:
+                result = written.get(timeout=float(self.cfg['Default']['server_timeout(sec.)']))
+
+            except queue.Empty:
+                self.logger.warning('Serial multiplexer did not answer the reset_wifi request in time!')
+                result = False
+
         data = create_data_dict('', result, {})
 
         return data
 
+    def _subscribe(self, data: Dict) -> None:
+        encoding = self.cfg['Default']['sys_encoding']
+
+        try:
+            if not isinstance(data, dict):
+                raise ValueError('Data must be an object')
+
+            events = parse_events(data.get('Events'))
+
+        except ValueError as err:
+            data = create_data_dict('subscribe', False, {'Error': str(err)})
+            self.client.sendall(json.dumps(data).encode(encoding) + b'\n')
+            return
+
+        sub = event_bus.subscribe(events, int(self.cfg['Default']['max_subscriber_events']))
+        timeout = float(self.cfg['Default']['server_timeout(sec.)'])
+
+        self.logger.info(f'Web client {self.address[0]}[{self.address[1]}] subscribed to {sorted(sub.events)}.')
+
+        try:
+            data = create_data_dict('', True, {'Events': sorted(sub.events)})
+            self.client.sendall(json.dumps(data).encode(encoding) + b'\n')
+
+            while not closeEvent.is_set():
+                msgs = sub.get(timeout)
+
+                if not msgs:
+                    # Heartbeat, also detects subscribers that went away.
+                    msgs = [{'Event': 'heartbeat', 'Time': time.time(), 'Data': {}}]
+
+                data = b''.join(
+                    json.dumps(create_data_dict('subscribe', True, m)).encode(encoding) + b'\n' for m in msgs
+                )
+                self.client.sendall(data)
+
+        finally:
+            event_bus.unsubscribe(sub)
+
+    def _get_sensor_records(self, data: Dict) -> None:
+        encoding = self.cfg['Default']['sys_encoding']
+
+        try:
+            limit = int(data.get('Limit', 10000))
+            chunk_size = int(data.get('ChunkSize', 500))
+            end = datetime.fromtimestamp(data['End'])
+
+            if limit <= 0 or chunk_size <= 0:
+                raise ValueError('Limit and ChunkSize must be positive')
+
+            if data.get('After') is not None:
+                # Next of the previous page is [DetectTime, Id], a bare DetectTime skips all its records.
+                after = data['After'] if isinstance(data['After'], list) else [data['After'], MAX_RECORD_ID]
+                lower = datetime.fromtimestamp(after[0])
+
+                query = SELECT_SENSOR_RECORDS_NEXT
+                params = (str(data['DeviceSN']), lower, lower, int(after[1]), end, limit)
+
+            else:
+                query = SELECT_SENSOR_RECORDS_FIRST
+                params = (str(data['DeviceSN']), datetime.fromtimestamp(data['Start']), end, limit)
+
+        except (AttributeError, KeyError, IndexError, TypeError, ValueError, OverflowError, OSError) as err:
+            data = create_data_dict('get_sensor_records', False, {'Error': f'Invalid parameters! {err!r}'})
+            self.client.sendall(json.dumps(data).encode(encoding) + b'\n')
+            return
+
+        # Bounded apart from the pool, exports must not take the connections of edges and the local system.
+        if not self.query_slots.acquire(timeout=float(self.cfg['Default']['server_timeout(sec.)'])):
+            data = create_data_dict('get_sensor_records', False, {'Error': 'server_busy'})
+            self.client.sendall(json.dumps(data).encode(encoding) + b'\n')
+            return
+
+        try:
+            self._stream_sensor_records(query, params, limit, chunk_size)
+
+        finally:
+            self.query_slots.release()
+
+    def _stream_sensor_records(self, query: str, params: Tuple, limit: int, chunk_size: int) -> None:
+        encoding = self.cfg['Default']['sys_encoding']
+
+        cnx = get_db_connection(self.cnxpool, db_breaker, metrics, self.logger)
+        if cnx is None:
+            data = create_data_dict('get_sensor_records', False, {'Error': 'database_unavailable'})
+            self.client.sendall(json.dumps(data).encode(encoding) + b'\n')
+            return
+
+        # Unbuffered, rows are read from the server one chunk at a time.
+        cursor = cnx.cursor(buffered=False)
+
+        try:
+            with profiler.stage('web.db_execute'):
+                cursor.execute(query, params)
+
+            count = 0
+            last = None
+
+            while True:
+                rows = cursor.fetchmany(chunk_size)
+                if not rows:
+                    break
+
+                count += len(rows)
+                last = [rows[-1][0].timestamp(), rows[-1][-1]]
+                rows = [[r[0].timestamp(), *r[1:-1]] for r in rows]
+
+                data = create_data_dict('get_sensor_records', True, {'Columns': SENSOR_RECORD_COLUMNS, 'Rows': rows})
+                self.client.sendall(json.dumps(data, default=float).encode(encoding) + b'\n')
+
+            # A full page means there may be more, continue with After = Next.
+            data = {'Done': True, 'Count': count, 'Next': last if count >= limit else None}
+            data = create_data_dict('get_sensor_records', True, data)
+            self.client.sendall(json.dumps(data).encode(encoding) + b'\n')
+
+        finally:
+            try:
+                cursor.close()
+
+            except mysql.connector.errors.Error:
+                cnx.consume_results()
+
+            cnx.close()
+
     def close(self) -> None:
         self.client.shutdown(socket.SHUT_RDWR)
         self.client.close()
 
     def run(self) -> None:
         try:
-            data = self.client.recv(int(self.cfg['Default']['max_bufsize']))
-            data = data.decode(self.cfg['Default']['sys_encoding'])
-            data = json.loads(data)
+            with profiler.stage('web.recv'):
+                data = self.client.recv(int(self.cfg['Default']['max_bufsize']))
 
-            try:
-                if data['Api'] == 'get_edges':
-                    data = self._get_edges()
+            with profiler.stage('web.decode'):
+                data = data.decode(self.cfg['Default']['sys_encoding'])
+                data = json.loads(data)
 
-                elif data['Api'] == 'reset_wifi':
-                    data = self._reset_wifi(data['Data'])
+            if data['Api'] == 'subscribe':
+                self._subscribe(data.get('Data', {}))
+                return
 
-                else:
-                    self.logger.warning(f'Received unknown message {data}!')
-                    data = create_data_dict('', False, {})
+            if data['Api'] == 'get_sensor_records':
+                self._get_sensor_records(data.get('Data', {}))
+                return
 
-            except BaseException as err:
-                err = f'Unable to handle web client request! Error: {err!r}'
-                self.logger.warning(err)
-                data = create_data_dict('', False, {})
+            with profiler.stage('web.dispatch'):
+                try:
+                    if data['Api'] == 'get_edges':
+                        data = self._get_edges()
+
+                    elif data['Api'] == 'reset_wifi':
+                        data = self._reset_wifi(data['Data'])
+
+                    elif data['Api'] == 'get_metrics':
+                        data = self._get_metrics()
 
-            data = json.dumps(data).encode(self.cfg['Default']['sys_encoding'])
-            self.client.send(data)
+                    elif data['Api'] == 'set_profiling':
+                        data = self._set_profiling(data['Data'])
+
+                    elif data['Api'] == 'get_profile':
+                        data = create_data_dict('', True, profiler.summary())
+
+                    else:
+                        self.logger.warning(f'Received unknown message {data}!', extra={'rate_key': 'unknown_message'})
+                        data = create_data_dict('', False, {})
+
+                except BaseException as err:
+                    err = f'Unable to handle web client request! Error: {err!r}'
+                    self.logger.warning(err)
+                    data = create_data_dict('', False, {})
+
+            with profiler.stage('web.send'):
+                data = json.dumps(data).encode(self.cfg['Default']['sys_encoding'])
+                self.client.sendall(data)
 
         except BaseException as err:
             err = f'Web client {self.address[0]}[{self.address[1]}] disconnected unexpectedly! Error: {err!r}'
-            self.logger.warning(err)
+            self.logger.warning(err, extra={'rate_key': 'web_disconnected'})
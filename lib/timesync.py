@@ -0,0 +1,186 @@
+import threading
+from collections import OrderedDict, deque
+from datetime import datetime, timedelta
+from typing import Dict, Tuple
+
+
+# An offset further than this from the estimate means the edge clock was set, not that it drifted.
+STEP_THRESHOLD = 1.
+STEP_DELAYS = 4
+
+
+class ClockEstimator:
+    def __init__(self, window: int = 8) -> None:
+        """NTP style clock estimate of one edge device, not thread safe on its own.
+
+        An exchange is T1 (edge sends), T2 (server receives), T3 (server replies)
+        and T4 (edge receives), T1 and T4 read from the edge clock. The offset of
+        the sample with the smallest round trip delay is trusted most, the drift
+        is the slope of the offsets over the window. A sample off the estimate by
+        more than STEP_THRESHOLD and STEP_DELAYS round trips means the edge set its
+        clock, the estimate then starts again from that sample.
+
+        :param window: number of recent samples kept
+        """
+        self.samples = deque(maxlen=window)
+        self.pending = None
+
+        self.offset = None
+        self.delay = None
+        self.drift = 0.
+        self.stamp = None
+        self.steps = 0
+
+        # Estimates frozen for records detected from an edge time on, (edge time, offset, drift, stamp).
+        self.applied = deque(maxlen=64)
+        self.latest_detect = None
+
+    def begin(self, t1: float, t2: float, t3: float) -> None:
+        self.pending = (t1, t2, t3)
+
+    def complete(self, t1: float, t4: float) -> bool:
+        """Finish the pending exchange with the time the edge received the reply.
+
+        :param t1: T1 of the exchange, to match it with the pending one
+        :param t4: edge time the reply was received
+        :return: True when a sample was added
+        """
+        if self.pending is None or self.pending[0] != t1:
+            return False
+
+        _, t2, t3 = self.pending
+        self.pending = None
+
+        delay = (t4 - t1) - (t3 - t2)
+        if delay < 0:
+            return False
+
+        offset = ((t2 - t1) + (t3 - t4)) / 2
+
+        if self.offset is not None and abs(offset - self.offset_at(t2)) > max(STEP_THRESHOLD, STEP_DELAYS * delay):
+            self._reset()
+
+        self.samples.append((t2, offset, delay))
+        self._update()
+
+        return True
+
+    def _reset(self) -> None:
+        # Neither the drift fit nor the frozen corrections may span the step.
+        self.samples.clear()
+        self.applied.clear()
+        self.latest_detect = None
+        self.drift = 0.
+        self.steps += 1
+
+    def _update(self) -> None:
+        self.stamp, self.offset, self.delay = min(self.samples, key=lambda s: s[2])
+
+        n = len(self.samples)
+        mean_t = sum(s[0] for s in self.samples) / n
+        mean_o = sum(s[1] for s in self.samples) / n
+        var_t = sum((s[0] - mean_t) ** 2 for s in self.samples)
+
+        # Seconds of offset gained per second, needs samples spread over some time.
+        if n > 1 and var_t > 0 and self.samples[-1][0] - self.samples[0][0] >= 60:
+            self.drift = sum((s[0] - mean_t) * (s[1] - mean_o) for s in self.samples) / var_t
+
+    def offset_at(self, t: float) -> float | None:
+        """Server time minus edge time at server time t."""
+        if self.offset is None:
+            return None
+
+        return self.offset + self.drift * (t - self.stamp)
+
+    def correction(self, detect_time: float) -> float | None:
+        """Offset for a record detected at edge time detect_time, always the same for the same record.
+
+        A new estimate only applies to records detected after the latest one seen, so a
+        retransmitted record gets the offset it got the first time.
+        """
+        if self.latest_detect is None or detect_time > self.latest_detect:
+            self.latest_detect = detect_time
+            estimate = (self.offset, self.drift, self.stamp)
+
+            if self.offset is not None and (not self.applied or self.applied[-1][1:] != estimate):
+                self.applied.append((detect_time, *estimate))
+
+        for start, offset, drift, stamp in reversed(self.applied):
+            if start <= detect_time:
+                return offset + drift * (detect_time - stamp)
+
+        return None
+
+    def to_dict(self) -> Dict:
+        return {
+            'Offset': self.offset,
+            'Delay': self.delay,
+            'Drift': self.drift * 1e6,
+            'Samples': len(self.samples),
+            'Steps': self.steps
+        }
+
+
+class TimeSync:
+    def __init__(self, max_devices: int = 1024) -> None:
+        """Thread safe clock estimates per DeviceSN, least recently used devices are forgotten.
+
+        :param max_devices: number of devices remembered
+        """
+        self.max_devices = max_devices
+
+        self._clocks = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _clock(self, device_sn: str) -> ClockEstimator:
+        clock = self._clocks.get(device_sn)
+
+        if clock is None:
+            if len(self._clocks) >= self.max_devices:
+                self._clocks.popitem(last=False)
+
+            clock = self._clocks[device_sn] = ClockEstimator()
+
+        else:
+            self._clocks.move_to_end(device_sn)
+
+        return clock
+
+    def exchange(self, device_sn: str, t1: float, t2: float, t3: float, previous: Tuple | None) -> Dict:
+        """Record one sync_time request.
+
+        :param device_sn: device serial number
+        :param t1: edge time the request was sent
+        :param t2: server time the request was received
+        :param t3: server time of the reply
+        :param previous: (T1, T4) of the previous exchange, as seen by the edge
+        :return: current estimate, offset and delay in sec., drift in ppm
+        """
+        with self._lock:
+            clock = self._clock(device_sn)
+
+            if previous is not None:
+                clock.complete(*previous)
+
+            clock.begin(t1, t2, t3)
+
+            return clock.to_dict()
+
+    def correct(self, device_sn: str, detect_time: datetime) -> datetime:
+        """Move the DetectTime of a record onto the server clock.
+
+        :param device_sn: device serial number
+        :param detect_time: time read from the edge clock
+        :return: corrected time, unchanged for records detected before the device had an estimate
+        """
+        with self._lock:
+            offset = self._clock(device_sn).correction(detect_time.timestamp())
+
+        if offset is None:
+            return detect_time
+
+        return detect_time + timedelta(seconds=offset)
+
+    def status(self) -> Dict[str, Dict]:
+        with self._lock:
+            return {sn: c.to_dict() for sn, c in self._clocks.items() if c.offset is not None}
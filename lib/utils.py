@@ -1,7 +1,8 @@
+import socket
 from configparser import ConfigParser
 from datetime import datetime
 from os import PathLike
-from typing import Tuple, Dict
+from typing import Tuple, Dict, List
 
 
 def check_time_to_wake_up(sleep_time: int) -> Tuple[bool, datetime]:
@@ -23,6 +24,24 @@ def key2head(kwargs: Dict) -> Dict:
     return kwargs_new
 
 
+def set_tcp_keepalive(sock: socket.socket, idle: float) -> None:
+    """Let the kernel probe idle connections so dead peers are noticed.
+
+    :param sock: connected socket
+    :param idle: seconds of idle time before the first probe, 0 to disable
+    """
+    if idle <= 0:
+        return
+
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_KEEPALIVE, 1)
+
+    # Linux only options, other platforms keep the system defaults.
+    if hasattr(socket, 'TCP_KEEPIDLE'):
+        sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_KEEPIDLE, max(1, int(idle)))
+        sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_KEEPINTVL, max(1, int(idle) // 4))
+        sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_KEEPCNT, 4)
+
+
 def create_data_dict(api: str, result: bool, data: Dict) -> Dict:
     dd = {
         'Api': api,
@@ -33,19 +52,37 @@ def create_data_dict(api: str, result: bool, data: Dict) -> Dict:
     return dd
 
 
-def create_config_file(cfg_path: str | PathLike[str]) -> None:
+def default_config() -> ConfigParser:
     cfg = ConfigParser()
     cfg['Default'] = {
         'device_sn': 'TEST0001',
         'log_path': './system.log',
+        'log_max_bytes': '5242880',
+        'log_backup_count': '3',
+        'log_queue_size': '10000',
+        'log_rate_limit(per min.)': '10',
         'sys_encoding': 'utf-8',
         'server_ip': '',
         'server_port': '',
         'web_port': '',
         'max_bufsize': '2048',
         'max_client_devices': '5',
+        'edge_rate_limit(per min.)': '6',
+        'edge_rate_burst': '10',
+        'edge_workers': '0',
         'max_web_clients': '20',
-        'server_timeout(sec.)': '5'
+        'max_subscriber_events': '100',
+        'max_web_queries': '2',
+        'server_timeout(sec.)': '5',
+        'edge_timeout(min.)': '30',
+        'tcp_keepalive(sec.)': '60',
+        'capture_path': '',
+        'capture_max_bytes': '104857600',
+        'db_failure_threshold': '3',
+        'db_retry_interval(sec.)': '10',
+        'db_connect_timeout(sec.)': '3',
+        'spool_path': './edge_spool.jsonl',
+        'correct_detect_time': '1'
     }
 
     cfg['Local'] = {
@@ -65,13 +102,49 @@ def create_config_file(cfg_path: str | PathLike[str]) -> None:
     }
 
     cfg['Edge'] = {
-        'arduino_uno_r4_wifi': 'VID:PID=2341:1002'
+        'arduino_uno_r4_wifi': 'VID:PID=2341:1002',
+        'serial_edges': '0'
     }
 
+    return cfg
+
+
+def create_config_file(cfg_path: str | PathLike[str]) -> None:
+    cfg = default_config()
+
     with open(cfg_path, 'w', encoding='utf-8') as f:
         cfg.write(f)
 
 
+def update_config_file(cfg_path: str | PathLike[str]) -> List[str]:
+    """Add the settings of newer versions to an existing config file, present values are kept.
+
+    :param cfg_path: config file
+    :return: added settings as 'section.key'
+    """
+    cfg = ConfigParser()
+    cfg.read(cfg_path, encoding='utf-8')
+
+    added = []
+    for section, defaults in default_config().items():
+        if section == cfg.default_section:
+            continue
+
+        if not cfg.has_section(section):
+            cfg.add_section(section)
+
+        for key, value in defaults.items():
+            if not cfg.has_option(section, key):
+                cfg[section][key] = value
+                added.append(f'{section}.{key}')
+
+    if added:
+        with open(cfg_path, 'w', encoding='utf-8') as f:
+            cfg.write(f)
+
+    return added
+
+
 def create_tmp_file(tmp_path: str | PathLike[str]) -> ConfigParser:
     tmp = ConfigParser()
     tmp['Default'] = {'not_close': 'DeleteMeToClose'}
@@ -1,144 +1,236 @@
+import time
+
+start_time = time.perf_counter()
+
 import configparser
 import logging
+import logging.handlers
+import multiprocessing
 import queue
 import threading
-import time
 
-import mysql.connector
+from lib.db import LazyConnectionPool
+from lib.logs import setup_logger
+from lib.settings import cfgPath, tmpPath, closeEvent, edges, startup_timer, capture, db_breaker, spool
+from lib.swps import server, serial_edge
+from lib.utils import create_config_file, create_tmp_file, update_config_file
+
+
+def start_local_sys(
+    cfg: configparser.ConfigParser,
+    cnxpool: LazyConnectionPool,
+    logger: logging.Logger
+) -> None:
+    # Hardware libraries are slow to import, keep them off the listener startup path.
+    from lib.swps import local
+
+    local.run_swps_local_sys(cfg, cnxpool, logger)
 
-from lib.settings import cfgPath, tmpPath, closeEvent, lock_edges, edges
-from lib.swps import local, server
-from lib.utils import create_config_file, create_tmp_file
 
 if __name__ == '__main__':
+    startup_timer.start = start_time
+    startup_timer.mark('import')
+
     if not cfgPath.is_file():
         create_config_file(cfgPath)
 
+    # Config files of older versions lack the newer settings.
+    cfg_added = update_config_file(cfgPath)
+
     tmp = create_tmp_file(tmpPath)
 
     cfg = configparser.ConfigParser()
     cfg.read(cfgPath, encoding='utf-8')
 
-    logger = logging.getLogger('root')
-    logger.setLevel(logging.INFO)
-    ch = logging.StreamHandler()
-    fh = logging.FileHandler(
-        filename=cfg['Default']['log_path'],
-        mode='a',
-        encoding='utf-8'
-    )
-
-    ch.setLevel(logging.INFO)
-    fh.setLevel(logging.INFO)
-    formatter = logging.Formatter(
-        '%(asctime)s | %(name)s | %(levelname)s : %(message)s'
-    )
-
-    ch.setFormatter(formatter)
-    fh.setFormatter(formatter)
-    logger.addHandler(ch)
-    logger.addHandler(fh)
-
-    dbconfig = {
-        'host': cfg['SQL']['host'],
-        'port': int(cfg['SQL']['port']),
-        'user': cfg['SQL']['user'],
-        'password': cfg['SQL']['password'],
-        'database': cfg['SQL']['database']
-    }
-
-    cnxpool = mysql.connector.pooling.MySQLConnectionPool(
-        pool_name='swps_sql_pool',
-        pool_size=int(cfg['Default']['max_client_devices'])+1,
-        **dbconfig
-    )
+    startup_timer.mark('config')
 
-    syst_list = []
+    logger, log_listener = setup_logger(cfg)
+
+    if cfg_added:
+        logger.info(f'Added default settings to {cfgPath}: {", ".join(cfg_added)}')
+
+    if cfg['Default']['capture_path']:
+        capture.open(cfg['Default']['capture_path'], int(cfg['Default']['capture_max_bytes']))
+        logger.info(f"Capturing edge traffic to {cfg['Default']['capture_path']}.")
 
-    t = threading.Thread(
-        target=local.run_swps_local_sys,
-        args=(cfg, cnxpool.get_connection(), logger)
-    )
-    lock_edges.acquire()
-    edges[cfg['Default']['device_sn']] = True
-    lock_edges.release()
-    syst_list.append(t)
-    t.start()
-
-    t = threading.Thread(
-        target=server.listen_serial_port,
-        args=(cfg, )
-    )
-    syst_list.append(t)
-    t.start()
-
-    queue_main = queue.Queue()
-    lock_main = threading.Lock()
-
-    t = threading.Thread(
-        target=server.listen_edge_clients,
-        args=(cfg, queue_main, lock_main)
-    )
-    syst_list.append(t)
-    t.start()
-
-    t = threading.Thread(
-        target=server.listen_web_clients,
-        args=(cfg, queue_main, lock_main)
-    )
-    syst_list.append(t)
-    t.start()
-
-    while bool(tmp['Default']['not_close']):
-        try:
-            with open(tmpPath, 'r', encoding='utf-8') as f:
-                tmp.read_file(f)
-
-        except BaseException as err:
-            logger.error(f'Failed to read tmp file! Error: {err!r}')
-            break
-
-        err = None
-        clients = []
-        if lock_main.acquire(timeout=float(cfg['Default']['server_timeout(sec.)'])):
-            while not queue_main.empty():
-                try:
-                    c = queue_main.get(timeout=float(cfg['Default']['server_timeout(sec.)']))
-                    clients.append(c)
-
-                except BaseException as err:
-                    err = f'Failed to get client from queue! Error: {err!r}'
-
-            lock_main.release()
-
-        if clients:
-            for c in clients:
-                if c[2]:
-                    t = threading.Thread(
-                        target=server.handle_edge_sys,
-                        args=(c[0], c[1], cfg, cnxpool.get_connection(), logger)
-                    )
-                    syst_list.append(t)
-                    t.start()
-
-                else:
-                    t = threading.Thread(
-                        target=server.handle_web_client,
-                        args=(c[0], c[1], cfg, logger)
-                    )
-                    t.start()
-
-        if err:
-            logger.warning(err)
-
-    closeEvent.set()
-
-    for t in syst_list:
-        t.join(timeout=10)
-        if t.is_alive():
-            logger.error('Failed to stop thread!')
-
-    logger.info('Close program.')
-
-    time.sleep(2)
-    tmpPath.unlink()
+    if cfg['Default']['spool_path']:
+        spool.open(cfg['Default']['spool_path'])
+
+    db_breaker.failure_threshold = int(cfg['Default']['db_failure_threshold'])
+    db_breaker.reset_timeout = float(cfg['Default']['db_retry_interval(sec.)'])
+
+    syst_list = []
+    edge_workers = []
+
+    # Whatever fails after the threads started, stop them so the service can be restarted.
+    try:
+        edges.register_local(cfg['Default']['device_sn'])
+
+        t = threading.Thread(target=server.watch_edge_liveness)
+        syst_list.append(t)
+        t.start()
+
+        t = threading.Thread(
+            target=server.watch_database,
+            args=(cfg, logger)
+        )
+        syst_list.append(t)
+        t.start()
+
+        t = threading.Thread(
+            target=server.listen_serial_port,
+            args=(cfg, )
+        )
+        syst_list.append(t)
+        t.start()
+
+        queue_main = queue.Queue()
+        lock_main = threading.Lock()
+        query_slots = threading.BoundedSemaphore(int(cfg['Default']['max_web_queries']))
+
+        edge_workers_num = int(cfg['Default']['edge_workers'])
+
+        if edge_workers_num > 0:
+            ctx = multiprocessing.get_context('spawn')
+            ipc_q = ctx.Queue()
+            log_q = ctx.Queue()
+            stop_workers = ctx.Event()
+
+            worker_log_listener = logging.handlers.QueueListener(log_q, *logger.handlers)
+            worker_log_listener.start()
+
+            for i in range(edge_workers_num):
+                p = ctx.Process(target=server.run_edge_worker, args=(i, ipc_q, log_q, stop_workers))
+                edge_workers.append(p)
+                p.start()
+
+            t = threading.Thread(
+                target=server.collect_edge_workers,
+                args=(ipc_q, )
+            )
+
+        else:
+            t = threading.Thread(
+                target=server.listen_edge_clients,
+                args=(cfg, queue_main, lock_main)
+            )
+
+        syst_list.append(t)
+        t.start()
+
+        t = threading.Thread(
+            target=server.listen_web_clients,
+            args=(cfg, queue_main, lock_main)
+        )
+        syst_list.append(t)
+        t.start()
+
+        startup_timer.mark('listeners')
+
+        dbconfig = {
+            'host': cfg['SQL']['host'],
+            'port': int(cfg['SQL']['port']),
+            'user': cfg['SQL']['user'],
+            'password': cfg['SQL']['password'],
+            'database': cfg['SQL']['database'],
+            'connection_timeout': int(cfg['Default']['db_connect_timeout(sec.)'])
+        }
+
+        def mark_pool_ready() -> None:
+            # The pool is created on first use, after the startup report when MySQL was down.
+            startup_timer.mark('pool')
+            logger.info(f'MySQL connection pool ready. Startup timing: {startup_timer.report()}')
+
+        cnxpool = LazyConnectionPool(
+            on_create=mark_pool_ready,
+            pool_name='swps_sql_pool',
+            pool_size=int(cfg['Default']['max_client_devices'])+int(cfg['Default']['max_web_queries'])+2,
+            **dbconfig
+        )
+
+        if int(cfg['Edge']['serial_edges']):
+            t = threading.Thread(
+                target=serial_edge.run_serial_edges,
+                args=(cfg, cnxpool, logger)
+            )
+            syst_list.append(t)
+            t.start()
+
+        t = threading.Thread(
+            target=start_local_sys,
+            args=(cfg, cnxpool, logger)
+        )
+        syst_list.append(t)
+        t.start()
+
+        logger.info(f'Startup timing: {startup_timer.report()}')
+
+        while bool(tmp['Default']['not_close']):
+            try:
+                with open(tmpPath, 'r', encoding='utf-8') as f:
+                    tmp.read_file(f)
+
+            except BaseException as err:
+                logger.error(f'Failed to read tmp file! Error: {err!r}')
+                break
+
+            err = None
+            clients = []
+            if lock_main.acquire(timeout=float(cfg['Default']['server_timeout(sec.)'])):
+                while not queue_main.empty():
+                    try:
+                        c = queue_main.get(timeout=float(cfg['Default']['server_timeout(sec.)']))
+                        clients.append(c)
+
+                    except BaseException as err:
+                        err = f'Failed to get client from queue! Error: {err!r}'
+
+                lock_main.release()
+
+            if clients:
+                for c in clients:
+                    if c[2]:
+                        t = threading.Thread(
+                            target=server.handle_edge_sys,
+                            args=(c[0], c[1], cfg, cnxpool, logger)
+                        )
+                        syst_list.append(t)
+                        t.start()
+
+                    else:
+                        t = threading.Thread(
+                            target=server.handle_web_client,
+                            args=(c[0], c[1], cfg, cnxpool, query_slots, logger)
+                        )
+                        t.start()
+
+            if err:
+                logger.warning(err)
+
+    finally:
+        closeEvent.set()
+
+        for t in syst_list:
+            t.join(timeout=10)
+            if t.is_alive():
+                logger.error('Failed to stop thread!')
+
+        if edge_workers:
+            stop_workers.set()
+
+            for p in edge_workers:
+                p.join(timeout=10)
+                if p.is_alive():
+                    logger.error('Failed to stop edge worker!')
+                    p.terminate()
+
+            worker_log_listener.stop()
+
+        capture.close()
+
+        logger.info('Close program.')
+
+        log_listener.stop()
+
+        time.sleep(2)
+        tmpPath.unlink(missing_ok=True)
@@ -0,0 +1,68 @@
+import json
+
+import pytest
+
+from lib import capture as capture_module
+from lib.capture import DIR_CLOSE, DIR_IN, DIR_OUT, TrafficCapture, read_capture
+from tools.replay import load_sessions, rewrite_sn
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = [1000.]
+    monkeypatch.setattr(capture_module.time, 'time', lambda: now[0])
+
+    return now
+
+
+def capture_run(path, clock, start: float) -> None:
+    clock[0] = start
+
+    capture = TrafficCapture()
+    capture.open(path, 1 << 20)
+
+    session_id = capture.new_session()
+    capture.record(session_id, DIR_IN, b'first')
+    capture.record(session_id, DIR_OUT, b'reply')
+
+    clock[0] += 2
+    capture.record(session_id, DIR_IN, b'second')
+    capture.record(session_id, DIR_CLOSE)
+    capture.close()
+
+
+def test_capture_round_trip(tmp_path, clock):
+    path = tmp_path / 'capture.bin'
+    capture_run(path, clock, 1000.)
+
+    records = [(direction, data) for _, _, direction, data in read_capture(path)]
+    assert (DIR_IN, b'first') in records and (DIR_OUT, b'reply') in records
+    assert records[-1] == (DIR_CLOSE, b'')
+
+
+def test_runs_are_kept_apart_without_the_idle_time_between_them(tmp_path, clock):
+    path = tmp_path / 'capture.bin'
+    capture_run(path, clock, 1000.)
+    capture_run(path, clock, 5000.)
+
+    sessions = load_sessions(path)
+
+    # Both runs reuse session id 1.
+    assert len(sessions) == 2
+    first, second = sorted(sessions.values())
+    assert [offset for offset, _ in first] == [0., 2.]
+    assert [offset for offset, _ in second] == [2., 4.]
+
+
+def test_rewrite_sn_appends_the_suffix_in_the_capture_encoding():
+    data = json.dumps({'Api': 'setup_edge', 'Data': {'DeviceSN': 'SWPS0001'}}).encode('utf-16')
+
+    msg = json.loads(rewrite_sn(data, '-R1', 'utf-16').decode('utf-16'))
+    assert msg['Data']['DeviceSN'] == 'SWPS0001-R1'
+
+
+def test_rewrite_sn_keeps_struct_frames_and_rejects_malformed_json():
+    assert rewrite_sn(b'\x01abc', '-R1', 'utf-8') == b'\x01abc'
+
+    with pytest.raises(ValueError):
+        rewrite_sn(b'{"Api": ', '-R1', 'utf-8')
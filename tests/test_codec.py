@@ -0,0 +1,76 @@
+import json
+from datetime import datetime
+
+import pytest
+
+from lib.codec import (
+    ACK, FRAME_ACK, FRAME_RETRY_AFTER, FRAME_SENSOR_RECORD, RETRY_AFTER, SENSOR_RECORD, SENSOR_RECORD_FIELDS,
+    decode_sensor_record, encode_ack, encode_replies, encode_retry_after, is_struct_frame, negotiate_encoding,
+    sensor_record_from_dict, sensor_record_to_dict
+)
+
+
+RECORD = {
+    'DeviceSN': 'SWPS0001',
+    'Temperature': 25.5,
+    'Humidity': 50.25,
+    'Pressure': 1013.5,
+    'RawValue0': 1,
+    'RawValue1': -2,
+    'RawValue2': 3,
+    'RawValue3': 27000,
+    'Voltage0': .5,
+    'Voltage1': 1.25,
+    'Voltage2': 2.,
+    'Voltage3': 3.25,
+    'DetectTime': 1760000000.25,
+    'PumpStartTime': 1500
+}
+
+
+def test_negotiate_encoding():
+    assert negotiate_encoding(['cbor', 'struct', 'json']) == 'struct'
+    assert negotiate_encoding('struct') == 'struct'
+    assert negotiate_encoding(['cbor']) == 'json'
+    assert negotiate_encoding(None) == 'json'
+
+
+def test_struct_frame_decodes_like_json():
+    frame = SENSOR_RECORD.pack(FRAME_SENSOR_RECORD, *(RECORD[f] for f in SENSOR_RECORD_FIELDS[1:]))
+
+    assert is_struct_frame(frame)
+    assert decode_sensor_record(memoryview(frame), 'SWPS0001') == sensor_record_from_dict(RECORD)
+
+
+def test_struct_frame_reads_from_a_larger_buffer():
+    buffer = bytearray(2048)
+    SENSOR_RECORD.pack_into(buffer, 0, FRAME_SENSOR_RECORD, *(RECORD[f] for f in SENSOR_RECORD_FIELDS[1:]))
+
+    assert decode_sensor_record(memoryview(buffer)[:SENSOR_RECORD.size], 'SWPS0001')[13] == datetime.fromtimestamp(
+        RECORD['DetectTime']
+    )
+
+
+def test_json_is_not_a_struct_frame():
+    assert not is_struct_frame(b'{"Api": "upload_sensor_record"}')
+    assert not is_struct_frame(b'')
+
+
+def test_sensor_record_round_trip():
+    data = sensor_record_to_dict(sensor_record_from_dict(RECORD))
+
+    assert data == dict(RECORD, PumpStartTime=1.5)
+
+
+def test_acks():
+    assert ACK.unpack(encode_ack(True)) == (FRAME_ACK, 1)
+    assert ACK.unpack(encode_ack(False)) == (FRAME_ACK, 0)
+    assert RETRY_AFTER.unpack(encode_retry_after(1.5)) == (FRAME_RETRY_AFTER, 0, 1.5)
+
+
+@pytest.mark.parametrize('sys_encoding', ['utf-8', 'utf-16'])
+def test_encode_replies(sys_encoding):
+    success, failure = encode_replies(sys_encoding)
+
+    assert json.loads(success.decode(sys_encoding))['Result'] == 1
+    assert json.loads(failure.decode(sys_encoding))['Result'] == 0
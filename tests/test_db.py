@@ -0,0 +1,73 @@
+import pytest
+
+pytest.importorskip('mysql.connector')
+
+from lib import db  # noqa: E402
+from lib.db import (  # noqa: E402
+    BREAKER_CLOSED, BREAKER_HALF_OPEN, BREAKER_OPEN, CircuitBreaker, RecentKeys, SENSOR_RECORD_COLUMNS,
+    SELECT_SENSOR_RECORDS_FIRST, SELECT_SENSOR_RECORDS_NEXT
+)
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = [1000.]
+    monkeypatch.setattr(db.time, 'monotonic', lambda: now[0])
+
+    return now
+
+
+def test_breaker_opens_after_consecutive_failures(clock):
+    breaker = CircuitBreaker(failure_threshold=3, reset_timeout=10.)
+
+    assert not breaker.record_failure()
+    assert not breaker.record_failure()
+    breaker.record_success()
+    assert not breaker.record_failure()
+    assert not breaker.record_failure()
+    assert breaker.record_failure()
+
+    assert breaker.state == BREAKER_OPEN
+    assert not breaker.allow()
+
+
+def test_breaker_probes_after_reset_timeout(clock):
+    breaker = CircuitBreaker(failure_threshold=1, reset_timeout=10.)
+    breaker.record_failure()
+
+    assert not breaker.probe_due()
+
+    clock[0] += 10
+    assert breaker.probe_due()
+    assert breaker.state == BREAKER_HALF_OPEN
+    assert not breaker.probe_due()
+
+    # A failed probe opens the breaker again, without reporting a new outage.
+    assert not breaker.record_failure()
+    assert breaker.state == BREAKER_OPEN
+
+    clock[0] += 10
+    assert breaker.probe_due()
+    assert breaker.record_success()
+    assert breaker.state == BREAKER_CLOSED and breaker.allow()
+
+
+def test_recent_keys_forget_least_recently_seen():
+    keys = RecentKeys(max_keys=2)
+    keys.add('a')
+    keys.add('b')
+
+    assert 'a' in keys
+
+    keys.add('c')
+
+    assert 'a' in keys and 'c' in keys
+    assert 'b' not in keys
+
+
+def test_keyset_queries_order_by_detect_time_and_id():
+    for query in (SELECT_SENSOR_RECORDS_FIRST, SELECT_SENSOR_RECORDS_NEXT):
+        assert 'ORDER BY DetectTime, Id' in query
+        assert query.count('%s') == (4 if query is SELECT_SENSOR_RECORDS_FIRST else 6)
+
+    assert SENSOR_RECORD_COLUMNS[0] == 'DetectTime'
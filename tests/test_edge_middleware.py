@@ -0,0 +1,138 @@
+import json
+import socket
+from datetime import datetime
+
+import pytest
+
+pytest.importorskip('mysql.connector')
+pytest.importorskip('serial')
+
+from lib.settings import metrics  # noqa: E402
+from lib.swps.server import SmartWaterPumpMiddleware  # noqa: E402
+from lib.utils import create_data_dict, default_config  # noqa: E402
+
+
+class StubCursor:
+    def __init__(self, cnx: 'StubConnection') -> None:
+        self.cnx = cnx
+        self.rowcount = 1
+
+    def execute(self, query: str, params: tuple) -> None:
+        self.cnx.executed.append(params)
+
+    def fetchall(self) -> list:
+        return [dict(r) for r in self.cnx.rows]
+
+    def close(self) -> None:
+        pass
+
+
+class StubConnection:
+    connection_id = 1
+
+    def __init__(self, rows: list = ()) -> None:
+        self.executed = []
+        self.rows = rows
+
+    def cursor(self, **kwargs) -> StubCursor:
+        return StubCursor(self)
+
+    def commit(self) -> None:
+        pass
+
+    def close(self) -> None:
+        pass
+
+
+@pytest.fixture
+def cfg():
+    cfg = default_config()
+    cfg['Default']['correct_detect_time'] = '0'
+    # TCP keepalive options do not apply to the Unix socket pair.
+    cfg['Default']['tcp_keepalive(sec.)'] = '0'
+
+    return cfg
+
+
+@pytest.fixture
+def edge(cfg):
+    peer, client = socket.socketpair()
+    mw = SmartWaterPumpMiddleware(client, ('127.0.0.1', 0), cfg, StubConnection())
+
+    yield mw
+
+    mw.close()
+    peer.close()
+
+
+def request(mw: SmartWaterPumpMiddleware, api: str, data: dict) -> dict:
+    return json.loads(mw.handle(json.dumps(create_data_dict(api, False, data)).encode('utf-8')))
+
+
+def record(device_sn: str, detect_time: float) -> dict:
+    return {
+        'DeviceSN': device_sn,
+        'Temperature': 25.,
+        'Humidity': 50.,
+        'Pressure': 1013.,
+        'RawValue0': 1,
+        'RawValue1': 2,
+        'RawValue2': 3,
+        'RawValue3': 4,
+        'Voltage0': .1,
+        'Voltage1': .2,
+        'Voltage2': .3,
+        'Voltage3': .4,
+        'DetectTime': detect_time,
+        'PumpStartTime': 0
+    }
+
+
+def test_retransmits_do_not_use_up_the_rate_budget(cfg, edge):
+    cfg['Default']['edge_rate_limit(per min.)'] = '0.001'
+    cfg['Default']['edge_rate_burst'] = '1'
+    request(edge, 'setup_edge', {'DeviceSN': 'TEST_RATE'})
+
+    assert request(edge, 'upload_sensor_record', record('TEST_RATE', 1760000000.))['Result'] == 1
+
+    duplicates = metrics.snapshot().get('duplicate_records', 0)
+    for _ in range(3):
+        assert request(edge, 'upload_sensor_record', record('TEST_RATE', 1760000000.))['Result'] == 1
+
+    assert metrics.snapshot()['duplicate_records'] == duplicates + 3
+    assert len(edge.cnx.executed) == 1
+
+    reply = request(edge, 'upload_sensor_record', record('TEST_RATE', 1760000001.))
+    assert reply['Result'] == 0 and reply['Data']['RetryAfter'] > 0
+
+
+def test_records_are_stored_with_the_edge_detect_time(edge):
+    request(edge, 'setup_edge', {'DeviceSN': 'TEST_STORE'})
+    request(edge, 'upload_sensor_record', record('TEST_STORE', 1760000000.))
+
+    assert edge.cnx.executed[0][13] == datetime.fromtimestamp(1760000000.)
+
+
+def test_set_params_during_an_outage_keeps_the_edge_settings(cfg):
+    params = {'DetectInterval': 5, 'PumpStartTime': 1.5, 'SoilMoisture': 21000}
+
+    for cnx, device_sn, expected in (
+        (StubConnection([params]), 'TEST_PARAMS', 1),
+        (None, 'TEST_PARAMS', 1),
+        (None, 'TEST_PARAMS_UNKNOWN', 0)
+    ):
+        peer, client = socket.socketpair()
+        mw = SmartWaterPumpMiddleware(client, ('127.0.0.1', 0), cfg, cnx)
+
+        request(mw, 'setup_edge', {'DeviceSN': device_sn})
+        reply = request(mw, 'set_params', {})
+
+        assert reply['Result'] == expected
+        if expected:
+            assert reply['Data']['SoilMoisture'] == 21000 and reply['Data']['PumpStartTime'] == 1500
+
+        else:
+            assert reply['Data'] == {'Error': 'database_unavailable'}
+
+        mw.close()
+        peer.close()
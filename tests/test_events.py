@@ -0,0 +1,52 @@
+import pytest
+
+from lib.events import ALL_EVENTS, EVENT_DROPPED, EVENT_EDGE_STATUS, EVENT_SENSOR_RECORD, EventBus, parse_events
+
+
+def test_parse_events():
+    assert parse_events(None) == ALL_EVENTS
+    assert parse_events([]) == ALL_EVENTS
+    assert parse_events(EVENT_EDGE_STATUS) == (EVENT_EDGE_STATUS,)
+    assert parse_events([EVENT_EDGE_STATUS, EVENT_SENSOR_RECORD]) == (EVENT_EDGE_STATUS, EVENT_SENSOR_RECORD)
+
+
+@pytest.mark.parametrize('events', [['edge_status', 'nope'], {'edge_status': 1}, 42])
+def test_parse_events_rejects_invalid(events):
+    with pytest.raises(ValueError):
+        parse_events(events)
+
+
+def test_publish_only_to_interested_subscribers():
+    bus = EventBus()
+    status = bus.subscribe([EVENT_EDGE_STATUS], 16)
+    records = bus.subscribe([EVENT_SENSOR_RECORD], 16)
+
+    bus.publish(EVENT_EDGE_STATUS, {'DeviceSN': 'SWPS0001', 'Status': True})
+
+    assert [e['Event'] for e in status.get(0)] == [EVENT_EDGE_STATUS]
+    assert records.get(0) == []
+
+
+def test_coalescing_and_dropped_events():
+    bus = EventBus()
+    sub = bus.subscribe(ALL_EVENTS, 2)
+
+    bus.publish(EVENT_EDGE_STATUS, {'Status': True}, 'a')
+    bus.publish(EVENT_EDGE_STATUS, {'Status': False}, 'a')
+    assert [e['Data'] for e in sub.get(0)] == [{'Status': False}]
+
+    for i in range(3):
+        bus.publish(EVENT_SENSOR_RECORD, {'i': i})
+
+    events = sub.get(0)
+    assert events[0]['Event'] == EVENT_DROPPED and events[0]['Data'] == {'Count': 1}
+    assert [e['Data'] for e in events[1:]] == [{'i': 1}, {'i': 2}]
+
+
+def test_unsubscribed_gets_nothing():
+    bus = EventBus()
+    sub = bus.subscribe(ALL_EVENTS, 16)
+    bus.unsubscribe(sub)
+    bus.publish(EVENT_EDGE_STATUS, {'Status': True})
+
+    assert sub.get(0) == []
@@ -0,0 +1,43 @@
+import struct
+from datetime import datetime
+
+import pytest
+
+pytest.importorskip('mysql.connector')
+
+from lib.export import NPY_HEADER_SIZE, ColumnarExporter, export_rows  # noqa: E402
+
+
+def row(detect_time: datetime, value: float) -> list:
+    return [detect_time, value, 50., 1013., 1, 2, 3, 4, .1, .2, .3, .4, 0.]
+
+
+def test_detect_time_is_exported_as_the_naive_wall_clock(tmp_path):
+    detect_time = datetime(2025, 6, 1, 12, 30, 0, 123456)
+
+    exporter = ColumnarExporter(tmp_path, 'SWPS0001')
+    exporter.append([row(detect_time, 25.)])
+    exporter.close()
+
+    with open(tmp_path / 'SWPS0001' / 'DetectTime.npy', 'rb') as f:
+        f.seek(NPY_HEADER_SIZE)
+        value, = struct.unpack('<q', f.read(8))
+
+    # 2025-06-01T12:30:00.123456 as datetime64[us], independent of the host time zone.
+    assert value == 1748781000123456
+
+
+def test_export_resumes_after_the_last_detect_time(tmp_path):
+    rows = [row(datetime(2025, 6, 1, 12, i), float(i)) for i in range(5)]
+
+    exporter = ColumnarExporter(tmp_path, 'SWPS0001')
+    assert export_rows(exporter, rows[:3], chunk_size=2) == 3
+    exporter.close()
+
+    exporter = ColumnarExporter(tmp_path, 'SWPS0001')
+    after = exporter.last_detect_time()
+    assert after == rows[2][0]
+
+    assert export_rows(exporter, [r for r in rows if r[0] > after]) == 2
+    assert exporter.count == 5
+    exporter.close()
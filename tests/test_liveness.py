@@ -0,0 +1,107 @@
+import pytest
+
+from lib import liveness
+from lib.events import EVENT_EDGE_STATUS, EventBus
+from lib.liveness import EdgeRegistry, TimerWheel
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = [1000.]
+    monkeypatch.setattr(liveness.time, 'time', lambda: now[0])
+
+    return now
+
+
+def advance(wheel: TimerWheel, ticks: int) -> list:
+    fired = []
+
+    for _ in range(ticks):
+        fired += wheel.advance()
+
+    return fired
+
+
+def test_timer_fires_after_its_delay():
+    wheel = TimerWheel(slots=8, tick=1.)
+    wheel.schedule('a', 3)
+
+    assert advance(wheel, 2) == []
+    assert advance(wheel, 1) == ['a']
+    assert advance(wheel, 16) == []
+
+
+def test_timer_longer_than_the_wheel():
+    wheel = TimerWheel(slots=4, tick=1.)
+    wheel.schedule('a', 10)
+
+    assert advance(wheel, 9) == []
+    assert advance(wheel, 1) == ['a']
+
+
+def test_reschedule_and_cancel():
+    wheel = TimerWheel(slots=8, tick=1.)
+    wheel.schedule('a', 2)
+    wheel.schedule('a', 5)
+    wheel.schedule('b', 2)
+    wheel.cancel('b')
+
+    assert advance(wheel, 4) == []
+    assert advance(wheel, 1) == ['a']
+
+
+def test_silent_session_expires(clock):
+    bus = EventBus()
+    sub = bus.subscribe([EVENT_EDGE_STATUS], 16)
+    registry = EdgeRegistry(bus, slots=8, tick=1.)
+    expired = []
+
+    session = registry.open_session(('10.0.0.2', 5000), 3, lambda: expired.append(True))
+    registry.bind(session, 'SWPS0001')
+
+    # A message resets the timeout, the timer is rescheduled when it fires.
+    for _ in range(2):
+        clock[0] += 1
+        registry.advance()
+    registry.touch(session)
+
+    for _ in range(2):
+        clock[0] += 1
+        registry.advance()
+
+    assert session.alive and not expired
+
+    clock[0] += 1
+    registry.advance()
+
+    assert not session.alive and expired == [True]
+    assert registry.status() == {'SWPS0001': False}
+    assert [e['Data'] for e in sub.get(0)] == [{'DeviceSN': 'SWPS0001', 'Status': False}]
+
+
+def test_reconnect_keeps_the_newest_session(clock):
+    registry = EdgeRegistry(EventBus())
+
+    old = registry.open_session(('10.0.0.2', 5000), 0)
+    registry.bind(old, 'SWPS0001')
+    new = registry.open_session(('10.0.0.2', 5001), 0)
+    registry.bind(new, 'SWPS0001')
+    registry.close_session(old)
+
+    assert registry.status() == {'SWPS0001': True}
+
+
+def test_merge_ignores_older_sessions(clock):
+    worker = EdgeRegistry(EventBus())
+    worker.track_dirty = True
+    session = worker.open_session(('10.0.0.2', 5000), 0)
+    worker.bind(session, 'SWPS0001')
+    records = worker.drain_dirty()
+
+    main = EdgeRegistry(EventBus())
+    clock[0] += 10
+    main.bind(main.open_session(('10.0.0.3', 5000), 0), 'SWPS0001')
+    main.merge(records)
+
+    assert main.snapshot()[0]['Address'] == '10.0.0.3[5000]'
+    assert worker.drain_dirty() == []
@@ -0,0 +1,67 @@
+import logging
+import queue
+
+from lib.logs import DroppingQueueHandler, RateLimitFilter
+from lib.utils import create_config_file, update_config_file
+
+
+def make_logger(name: str, handler: logging.Handler) -> logging.Logger:
+    logger = logging.getLogger(name)
+    logger.handlers = [handler]
+    logger.propagate = False
+    logger.setLevel(logging.INFO)
+
+    return logger
+
+
+def test_dropped_records_are_reported_when_the_queue_has_room():
+    q = queue.Queue(2)
+    logger = make_logger('test.dropping', DroppingQueueHandler(q))
+
+    for i in range(5):
+        logger.warning('message %d', i)
+
+    assert logger.handlers[0].dropped == 3
+
+    q.get()
+    q.get()
+    logger.warning('after the flood')
+
+    messages = [q.get_nowait().getMessage() for _ in range(q.qsize())]
+    assert messages == ['after the flood', '3 log records dropped, the log queue was full.']
+
+
+def test_rate_limit_filter_suppresses_by_key():
+    q = queue.Queue()
+    handler = DroppingQueueHandler(q)
+    handler.addFilter(RateLimitFilter(rate=1e-9, burst=2))
+    logger = make_logger('test.rate', handler)
+
+    for _ in range(5):
+        logger.warning('same', extra={'rate_key': 'k'})
+
+    logger.warning('other')
+
+    assert [r.getMessage() for r in list(q.queue)] == ['same', 'same', 'other']
+
+
+def test_update_config_file_adds_missing_settings(tmp_path):
+    path = tmp_path / 'config.ini'
+    path.write_text('[Default]\ndevice_sn = SWPS0009\nlog_path = ./x.log\n', encoding='utf-8')
+
+    added = update_config_file(path)
+
+    assert 'Default.log_queue_size' in added
+    assert 'SQL.host' in added
+    assert 'Default.device_sn' not in added
+    assert update_config_file(path) == []
+
+    text = path.read_text(encoding='utf-8')
+    assert 'device_sn = SWPS0009' in text
+
+
+def test_created_config_file_is_complete(tmp_path):
+    path = tmp_path / 'config.ini'
+    create_config_file(path)
+
+    assert update_config_file(path) == []
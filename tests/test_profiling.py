@@ -0,0 +1,38 @@
+import pytest
+
+from lib.profiling import Profiler, StartupTimer
+
+
+def test_stages_are_recorded_only_while_enabled():
+    profiler = Profiler()
+
+    with profiler.stage('off'):
+        pass
+
+    profiler.start()
+    with profiler.stage('on'):
+        pass
+    profiler.stop()
+
+    stages = profiler.summary()['Stages']
+    assert 'on' in stages and 'off' not in stages
+
+
+@pytest.mark.parametrize('interval', [0, -1, 1e-6, float('nan')])
+def test_sampling_interval_must_be_sane(interval):
+    profiler = Profiler()
+
+    with pytest.raises(ValueError):
+        profiler.start(True, interval)
+
+    assert not profiler.enabled
+
+
+def test_startup_timer_keeps_the_first_mark():
+    timer = StartupTimer(start=0.)
+    timer.mark('pool')
+    first = timer.stages['pool']
+    timer.mark('pool')
+
+    assert timer.stages['pool'] == first
+    assert timer.report().startswith('pool ')
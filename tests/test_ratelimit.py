@@ -0,0 +1,51 @@
+import pytest
+
+from lib import ratelimit
+from lib.ratelimit import KeyedRateLimiter, TokenBucket
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = [1000.]
+    monkeypatch.setattr(ratelimit.time, 'monotonic', lambda: now[0])
+
+    return now
+
+
+def test_token_bucket_allows_burst_then_refills(clock):
+    bucket = TokenBucket(rate=2., burst=3.)
+
+    assert [bucket.consume() for _ in range(4)] == [True, True, True, False]
+    assert bucket.retry_after() == pytest.approx(.5)
+
+    clock[0] += .5
+    assert bucket.consume()
+    assert not bucket.consume()
+
+
+def test_token_bucket_never_exceeds_burst(clock):
+    bucket = TokenBucket(rate=10., burst=2.)
+
+    clock[0] += 60
+    assert [bucket.consume() for _ in range(3)] == [True, True, False]
+
+
+def test_keyed_rate_limiter_limits_each_key(clock):
+    limiter = KeyedRateLimiter()
+
+    assert limiter.acquire('a', 1., 1.) == 0.
+    assert limiter.acquire('a', 1., 1.) == pytest.approx(1.)
+    assert limiter.acquire('b', 1., 1.) == 0.
+
+
+def test_keyed_rate_limiter_forgets_least_recently_used(clock):
+    limiter = KeyedRateLimiter(max_keys=2)
+
+    limiter.acquire('a', 1., 1.)
+    limiter.acquire('b', 1., 1.)
+    limiter.acquire('a', 1., 1.)
+    limiter.acquire('c', 1., 1.)
+
+    # 'a' is still limited, 'b' was evicted and starts with a full bucket again.
+    assert limiter.acquire('a', 1., 1.) > 0.
+    assert limiter.acquire('b', 1., 1.) == 0.
@@ -0,0 +1,92 @@
+import json
+import queue
+
+import pytest
+
+pytest.importorskip('mysql.connector')
+pytest.importorskip('serial')
+
+from lib.settings import ser_devices, ser_outbox  # noqa: E402
+from lib.swps import serial_edge  # noqa: E402
+from lib.utils import default_config  # noqa: E402
+
+
+class StubSerial:
+    def __init__(self, name: str, fail: bool = False) -> None:
+        self.port = name
+        self.fail = fail
+        self.written = []
+
+    def write(self, data: bytes) -> None:
+        if self.fail:
+            raise OSError('port is gone')
+
+        self.written.append(data)
+
+    def fileno(self) -> int:
+        return -1
+
+    def close(self) -> None:
+        pass
+
+
+class StubSelector:
+    def unregister(self, fd: int) -> None:
+        pass
+
+    def select(self, timeout: float) -> list:
+        return []
+
+
+@pytest.fixture
+def mux(monkeypatch):
+    mux = serial_edge.SerialEdgeMultiplexer(default_config(), None)
+    mux.selector = StubSelector()
+
+    yield mux
+
+    for name in list(mux.ports):
+        ser_devices.pop(name, None)
+
+
+def attach(mux, name: str, fail: bool = False) -> StubSerial:
+    ser = StubSerial(name, fail)
+    mux.ports[name] = {'serial': ser, 'buffer': bytearray(), 'middleware': None, 'device_sn': None, 'probed': 0.}
+
+    return ser
+
+
+def test_device_sn_is_probed_until_answered(mux, monkeypatch):
+    now = [100.]
+    monkeypatch.setattr(serial_edge.time, 'monotonic', lambda: now[0])
+    ser = attach(mux, 'TEST_PORT0')
+
+    mux._probe_ports()
+    mux._probe_ports()
+    assert len(ser.written) == 1
+
+    now[0] += serial_edge.PROBE_INTERVAL
+    mux._probe_ports()
+    assert len(ser.written) == 2
+
+    reply = json.dumps({'Api': '', 'Result': 1, 'Data': {'DeviceSN': 'SWPS0042'}}).encode('utf-8')
+    mux._handle_line('TEST_PORT0', reply)
+    assert ser_devices['TEST_PORT0'] == 'SWPS0042'
+
+    now[0] += serial_edge.PROBE_INTERVAL
+    mux._probe_ports()
+    assert len(ser.written) == 2
+
+
+def test_outbox_write_failures_are_reported(mux, monkeypatch):
+    monkeypatch.setattr(serial_edge, 'ser_edges', ['TEST_PORT1', 'TEST_PORT2'])
+    monkeypatch.setattr(mux, '_probe_ports', lambda: None)
+    attach(mux, 'TEST_PORT1')
+    attach(mux, 'TEST_PORT2', fail=True)
+
+    written = queue.Queue(1)
+    ser_outbox.put((b'{}', written))
+    mux.run()
+
+    assert written.get_nowait() is False
+    assert 'TEST_PORT2' not in mux.ports
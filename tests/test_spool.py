@@ -0,0 +1,48 @@
+from datetime import datetime
+
+from lib.spool import RecordSpool
+
+
+def record(detect_time: datetime) -> tuple:
+    return ('SWPS0001', 'SWPS0001', 25., 50., 1013., 1, 2, 3, 4, .1, .2, .3, .4, detect_time, 500.)
+
+
+def test_spool_round_trip(tmp_path):
+    spool = RecordSpool()
+    spool.open(tmp_path / 'spool.jsonl')
+
+    records = [record(datetime(2025, 6, 1, 12, i, 0, 5)) for i in range(3)]
+    for r in records:
+        spool.append(r)
+
+    assert spool.pending()
+    assert list(spool.take()) == records
+
+    spool.done()
+    assert not spool.pending()
+
+
+def test_interrupted_replay_is_repeated_and_new_records_wait(tmp_path):
+    spool = RecordSpool()
+    spool.open(tmp_path / 'spool.jsonl')
+    spool.append(record(datetime(2025, 6, 1, 12, 0)))
+
+    taken = spool.take()
+    next(taken)
+    spool.append(record(datetime(2025, 6, 1, 12, 1)))
+
+    # Not done, the same records are replayed again before the new ones.
+    assert [r[13].minute for r in spool.take()] == [0]
+    spool.done()
+    assert [r[13].minute for r in spool.take()] == [1]
+
+
+def test_torn_last_line_is_skipped(tmp_path):
+    spool = RecordSpool()
+    spool.open(tmp_path / 'spool.jsonl')
+    spool.append(record(datetime(2025, 6, 1, 12, 0)))
+
+    with open(spool.path, 'a', encoding='utf-8') as f:
+        f.write('["SWPS0001", ')
+
+    assert len(list(spool.take())) == 1
@@ -0,0 +1,88 @@
+from datetime import datetime
+
+import pytest
+
+from lib.timesync import ClockEstimator, TimeSync
+
+
+class Edge:
+    """Edge clock offset seconds behind the server and gaining drift seconds per second."""
+
+    def __init__(self, offset: float, drift: float = 0.) -> None:
+        self.offset = offset
+        self.drift = drift
+
+    def time(self, server_time: float) -> float:
+        return server_time - self.offset + self.drift * (server_time - 1e9)
+
+    def sync(self, clock: ClockEstimator, server_time: float, delay: float = .01) -> None:
+        t1 = self.time(server_time)
+        t2 = server_time + delay / 2
+        t3 = t2 + .001
+        clock.begin(t1, t2, t3)
+        clock.complete(t1, self.time(t3 + delay / 2))
+
+
+def test_offset_and_drift():
+    edge = Edge(offset=100., drift=50e-6)
+    clock = ClockEstimator()
+
+    for i in range(8):
+        edge.sync(clock, 1e9 + 60 * i)
+
+    assert clock.offset_at(1e9 + 420) == pytest.approx(100. - 50e-6 * 420, abs=1e-3)
+    assert clock.drift == pytest.approx(-50e-6, rel=.01)
+    assert clock.steps == 0
+
+
+def test_exchange_needs_matching_t1():
+    clock = ClockEstimator()
+    clock.begin(1., 101., 101.001)
+
+    assert not clock.complete(2., 1.01)
+    assert clock.offset is None
+
+
+def test_retransmit_keeps_its_correction():
+    sync = TimeSync()
+    edge = Edge(offset=100.)
+    clock = sync._clock('SWPS0001')
+
+    edge.sync(clock, 1e9)
+    first = sync.correct('SWPS0001', datetime.fromtimestamp(edge.time(1e9 + 10)))
+
+    # A better estimate must not move records already stored.
+    Edge(offset=100.5).sync(clock, 1e9 + 20, delay=.001)
+    assert sync.correct('SWPS0001', datetime.fromtimestamp(edge.time(1e9 + 10))) == first
+    assert sync.correct('SWPS0001', datetime.fromtimestamp(edge.time(1e9 + 30))).timestamp() == pytest.approx(
+        1e9 + 30.5, abs=1e-3
+    )
+
+
+def test_clock_step_restarts_the_estimate():
+    edge = Edge(offset=100.)
+    clock = ClockEstimator()
+
+    for i in range(4):
+        edge.sync(clock, 1e9 + 60 * i)
+        clock.correction(edge.time(1e9 + 60 * i + 1))
+
+    # The edge applies the offset to its RTC.
+    edge.offset = 0.
+
+    for i in range(4, 8):
+        edge.sync(clock, 1e9 + 60 * i)
+        detect_time = edge.time(1e9 + 60 * i + 1)
+        assert detect_time + clock.correction(detect_time) == pytest.approx(1e9 + 60 * i + 1, abs=1e-3)
+
+    assert clock.steps == 1
+    assert clock.drift == pytest.approx(0., abs=1e-7)
+
+
+def test_small_offset_change_is_not_a_step():
+    clock = ClockEstimator()
+    Edge(offset=100.).sync(clock, 1e9)
+    Edge(offset=100.2).sync(clock, 1e9 + 60)
+
+    assert clock.steps == 0
+    assert len(clock.samples) == 2
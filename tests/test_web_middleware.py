@@ -0,0 +1,136 @@
+import json
+import socket
+import threading
+from datetime import datetime
+
+import pytest
+
+pytest.importorskip('mysql.connector')
+pytest.importorskip('serial')
+
+from lib.db import SELECT_SENSOR_RECORDS_FIRST, SENSOR_RECORD_COLUMNS  # noqa: E402
+from lib.swps.server import WebClientMiddleware  # noqa: E402
+from lib.utils import default_config  # noqa: E402
+
+
+def table_rows() -> list:
+    """Rows as SELECT_SENSOR_RECORDS_* returns them, several records share a DetectTime."""
+    rows = []
+
+    for i in range(10):
+        detect_time = datetime.fromtimestamp(1760000000 + i // 3)
+        rows.append((detect_time, *[float(i)] * (len(SENSOR_RECORD_COLUMNS) - 1), i + 1))
+
+    return rows
+
+
+class TableCursor:
+    """Evaluates the keyset queries on a list instead of MySQL."""
+
+    def __init__(self, rows: list) -> None:
+        self.rows = rows
+        self.result = []
+
+    def execute(self, query: str, params: tuple) -> None:
+        if query == SELECT_SENSOR_RECORDS_FIRST:
+            _, start, end, limit = params
+            rows = [r for r in self.rows if start <= r[0] < end]
+
+        else:
+            _, after, _, after_id, end, limit = params
+            rows = [r for r in self.rows if (r[0], r[-1]) > (after, after_id) and r[0] < end]
+
+        self.result = sorted(rows, key=lambda r: (r[0], r[-1]))[:limit]
+
+    def fetchmany(self, size: int) -> list:
+        rows, self.result = self.result[:size], self.result[size:]
+
+        return rows
+
+    def close(self) -> None:
+        pass
+
+
+class TableConnection:
+    def __init__(self, rows: list) -> None:
+        self.rows = rows
+
+    def cursor(self, **kwargs) -> TableCursor:
+        return TableCursor(self.rows)
+
+    def close(self) -> None:
+        pass
+
+
+class TablePool:
+    def __init__(self, rows: list) -> None:
+        self.rows = rows
+
+    def get_connection(self) -> TableConnection:
+        return TableConnection(self.rows)
+
+
+def get_sensor_records(data: dict, slots: threading.Semaphore = None) -> list:
+    cfg = default_config()
+    cfg['Default']['server_timeout(sec.)'] = '0.1'
+
+    peer, client = socket.socketpair()
+    web = WebClientMiddleware(
+        client, ('127.0.0.1', 0), cfg, TablePool(table_rows()), slots or threading.BoundedSemaphore(1)
+    )
+
+    try:
+        web._get_sensor_records(dict(data, DeviceSN='SWPS0001'))
+        client.shutdown(socket.SHUT_WR)
+
+        reply = b''
+        while chunk := peer.recv(65536):
+            reply += chunk
+
+    finally:
+        client.close()
+        peer.close()
+
+    return [json.loads(line)['Data'] for line in reply.decode('utf-8').splitlines()]
+
+
+def test_pages_split_records_with_the_same_detect_time():
+    seen = []
+    data = {'Start': 1760000000, 'End': 1760000100, 'Limit': 4, 'ChunkSize': 3}
+
+    while True:
+        replies = get_sensor_records(data)
+        seen += [r[1] for reply in replies[:-1] for r in reply['Rows']]
+
+        if replies[-1]['Next'] is None:
+            break
+
+        data['After'] = replies[-1]['Next']
+
+    # Every record once and in order, though pages end inside a group of equal DetectTime.
+    assert seen == [float(i) for i in range(10)]
+
+
+def test_bare_after_skips_the_whole_second():
+    replies = get_sensor_records({'After': 1760000000, 'End': 1760000100})
+
+    assert [r[1] for r in replies[0]['Rows']][:1] == [3.]
+    assert replies[-1] == {'Done': True, 'Count': 7, 'Next': None}
+
+
+@pytest.mark.parametrize('data', [
+    {'Start': 1760000000},
+    {'Start': 1760000000, 'End': 1760000100, 'Limit': 0},
+    {'After': ['x', 1], 'End': 1760000100},
+])
+def test_invalid_parameters(data):
+    replies = get_sensor_records(data)
+
+    assert replies[0]['Error'].startswith('Invalid parameters!')
+
+
+def test_busy_when_no_query_slot():
+    slots = threading.BoundedSemaphore(1)
+    slots.acquire()
+
+    assert get_sensor_records({'Start': 1760000000, 'End': 1760000100}, slots) == [{'Error': 'server_busy'}]
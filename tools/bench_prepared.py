@@ -0,0 +1,86 @@
+"""Compare text queries with cached prepared statements on the hot queries.
+
+Run from the program folder against the database in config.ini:
+    python -m tools.bench_prepared --device-sn SWPS0001 -n 2000
+
+Inserts are executed inside a transaction that is rolled back.
+"""
+import argparse
+import configparser
+import time
+from datetime import datetime
+
+import mysql.connector
+
+from lib.db import INSERT_SENSOR_RECORD, SELECT_EDGE_PARAMS, StatementCache
+from lib.settings import cfgPath
+
+
+def bench_text(cnx, query: str, params: tuple, n: int) -> float:
+    start = time.perf_counter()
+
+    for _ in range(n):
+        cursor = cnx.cursor()
+        cursor.execute(query, params)
+        if cursor.with_rows:
+            cursor.fetchall()
+        cursor.close()
+
+    return time.perf_counter() - start
+
+
+def bench_prepared(cnx, query: str, params: tuple, n: int) -> float:
+    stmts = StatementCache(cnx)
+    start = time.perf_counter()
+
+    for _ in range(n):
+        cursor = stmts.execute(query, params)
+        if cursor.with_rows:
+            cursor.fetchall()
+
+    elapsed = time.perf_counter() - start
+    stmts.close()
+
+    return elapsed
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--device-sn', required=True, help='registered edge device serial number')
+    parser.add_argument('-n', type=int, default=1000, help='executions per case')
+    args = parser.parse_args()
+
+    cfg = configparser.ConfigParser()
+    cfg.read(cfgPath, encoding='utf-8')
+
+    cnx = mysql.connector.connect(
+        host=cfg['SQL']['host'],
+        port=int(cfg['SQL']['port']),
+        user=cfg['SQL']['user'],
+        password=cfg['SQL']['password'],
+        database=cfg['SQL']['database']
+    )
+
+    record = (
+        args.device_sn, args.device_sn, 25., 50., 1013., 1, 2, 3, 4, .1, .2, .3, .4, datetime.now(), .5
+    )
+    cases = (
+        ('select edge params', SELECT_EDGE_PARAMS, (args.device_sn, )),
+        ('insert sensor record', INSERT_SENSOR_RECORD, record)
+    )
+
+    for name, query, params in cases:
+        cnx.start_transaction()
+        t_text = bench_text(cnx, query, params, args.n)
+        cnx.rollback()
+
+        cnx.start_transaction()
+        t_prep = bench_prepared(cnx, query, params, args.n)
+        cnx.rollback()
+
+        print(
+            f'{name}: text {args.n / t_text:.0f} ops/s, prepared {args.n / t_prep:.0f} ops/s '
+            f'({t_text / t_prep:.2f}x)'
+        )
+
+    cnx.close()
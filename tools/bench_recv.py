@@ -0,0 +1,248 @@
+"""Measure the allocations of the edge receive path.
+
+Messages go over a loopback TCP connection, no database is needed:
+    python -m tools.bench_recv -n 20000 --profile --capture ./bench.bin
+
+Three paths handle the same messages:
+    old          receives a new bytes object, decodes it to str and encodes every reply
+    buffered     receives into a reused bytearray, parses from a view of it and sends
+                 pre-encoded replies
+    middleware   SmartWaterPumpMiddleware.run with a stub MySQL connection, including
+                 rate limiting, metrics, liveness, events, profiler stages (--profile)
+                 and traffic capture (--capture)
+old and buffered only differ in the receive path, the middleware shows what a whole
+request costs. tracemalloc measures the peak memory allocated per message.
+"""
+import argparse
+import configparser
+import itertools
+import json
+import socket
+import tempfile
+import time
+import tracemalloc
+from typing import Callable, Iterator, Tuple
+
+from lib.codec import (
+    ACK, FRAME_ACK, FRAME_SENSOR_RECORD, SENSOR_RECORD, decode_sensor_record, encode_ack, encode_replies,
+    is_struct_frame, sensor_record_from_dict
+)
+from lib.settings import capture, profiler
+from lib.swps.server import SmartWaterPumpMiddleware
+from lib.utils import create_config_file, create_data_dict
+
+
+BUFSIZE = 2048
+DEVICE_SN = 'SWPS0001'
+
+# Every record gets its own DetectTime, otherwise all but the first are duplicates.
+detect_times = itertools.count(1760000000)
+
+
+class StubCursor:
+    rowcount = 1
+
+    def execute(self, query: str, params: Tuple) -> None:
+        pass
+
+    def fetchall(self) -> list:
+        return []
+
+    def close(self) -> None:
+        pass
+
+
+class StubConnection:
+    connection_id = 1
+
+    def cursor(self, **kwargs) -> StubCursor:
+        return StubCursor()
+
+    def commit(self) -> None:
+        pass
+
+    def close(self) -> None:
+        pass
+
+
+def json_messages(n: int) -> Iterator[bytes]:
+    for detect_time in itertools.islice(detect_times, n):
+        yield json.dumps(create_data_dict('upload_sensor_record', False, {
+            'DeviceSN': DEVICE_SN,
+            'Temperature': 25.1,
+            'Humidity': 50.2,
+            'Pressure': 1013.3,
+            'RawValue0': 1,
+            'RawValue1': 2,
+            'RawValue2': 3,
+            'RawValue3': 27000,
+            'Voltage0': .1,
+            'Voltage1': .2,
+            'Voltage2': .3,
+            'Voltage3': 3.3,
+            'DetectTime': float(detect_time),
+            'PumpStartTime': 500
+        })).encode('utf-8')
+
+
+def struct_messages(n: int) -> Iterator[bytes]:
+    for detect_time in itertools.islice(detect_times, n):
+        yield SENSOR_RECORD.pack(
+            FRAME_SENSOR_RECORD, 25.1, 50.2, 1013.3, 1, 2, 3, 27000, .1, .2, .3, 3.3, float(detect_time), 500
+        )
+
+
+def connect() -> Tuple[socket.socket, socket.socket]:
+    listener = socket.create_server(('127.0.0.1', 0))
+    edge = socket.create_connection(listener.getsockname())
+    client, _ = listener.accept()
+    listener.close()
+
+    for sock in (edge, client):
+        sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+
+    return edge, client
+
+
+class OldPath:
+    def __init__(self, sock: socket.socket) -> None:
+        self.sock = sock
+
+    def __call__(self) -> None:
+        data = self.sock.recv(BUFSIZE)
+
+        if data[0] == FRAME_SENSOR_RECORD:
+            decode_sensor_record(data, DEVICE_SN)
+            reply = ACK.pack(FRAME_ACK, 1)
+
+        else:
+            data = json.loads(data.decode('utf-8'))
+            sensor_record_from_dict(data['Data'])
+            reply = json.dumps(create_data_dict('', True, {})).encode('utf-8')
+
+        self.sock.send(reply)
+
+
+class BufferedPath:
+    def __init__(self, sock: socket.socket) -> None:
+        self.sock = sock
+        self.buffer = bytearray(BUFSIZE)
+        self.view = memoryview(self.buffer)
+        self.reply_success, _ = encode_replies('utf-8')
+
+    def __call__(self) -> None:
+        n = self.sock.recv_into(self.buffer)
+        data = self.view[:n]
+
+        if is_struct_frame(data):
+            decode_sensor_record(data, DEVICE_SN)
+            reply = encode_ack(True)
+
+        else:
+            data = json.loads(str(data, 'utf-8'))
+            sensor_record_from_dict(data['Data'])
+            reply = self.reply_success
+
+        self.sock.send(reply)
+
+
+class MiddlewarePath:
+    def __init__(self, sock: socket.socket, encoding: str, cfg: configparser.ConfigParser) -> None:
+        self.mw = SmartWaterPumpMiddleware(sock, sock.getpeername(), cfg, StubConnection())
+        self.setup = json.dumps(create_data_dict('setup_edge', False, {
+            'DeviceSN': DEVICE_SN,
+            'Encoding': [encoding]
+        })).encode('utf-8')
+
+    def __call__(self) -> None:
+        self.mw.run()
+
+        if not self.mw.keep_server:
+            raise RuntimeError('The middleware closed the session, see the log')
+
+    def close(self) -> None:
+        self.mw.close()
+
+
+def run(handler: Callable[[], None], edge: socket.socket, messages: list, traced: bool) -> float:
+    """Handle the messages, return the summed per-message allocation peaks when traced, else the elapsed time."""
+    allocated = 0
+    start = time.perf_counter()
+
+    for message in messages:
+        edge.sendall(message)
+
+        if traced:
+            tracemalloc.reset_peak()
+            before = tracemalloc.get_traced_memory()[0]
+            handler()
+            allocated += tracemalloc.get_traced_memory()[1] - before
+
+        else:
+            handler()
+
+        edge.recv(BUFSIZE)
+
+    return allocated if traced else time.perf_counter() - start
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('-n', type=int, default=10000, help='messages per case')
+    parser.add_argument('--profile', action='store_true', help='time the request stages as set_profiling does')
+    parser.add_argument('--capture', default='', help='capture the messages to this file')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        create_config_file(f'{tmp}/config.ini')
+        cfg = configparser.ConfigParser()
+        cfg.read(f'{tmp}/config.ini', encoding='utf-8')
+
+    # Measure the request path, not the rate limit replies.
+    cfg['Default']['edge_rate_limit(per min.)'] = '1e12'
+    cfg['Default']['edge_rate_burst'] = '1e12'
+
+    if args.profile:
+        profiler.start()
+
+    if args.capture:
+        capture.open(args.capture, 2 ** 40)
+
+    for encoding, messages in (('json', json_messages), ('struct', struct_messages)):
+        paths = {
+            'old': OldPath,
+            'buffered': BufferedPath,
+            'middleware': lambda sock: MiddlewarePath(sock, encoding, cfg)
+        }
+
+        for name, path in paths.items():
+            edge, client = connect()
+            handler = path(client)
+
+            if isinstance(handler, MiddlewarePath):
+                run(handler, edge, [handler.setup], False)
+
+            # Warm up, the first messages allocate caches.
+            run(handler, edge, list(messages(100)), False)
+
+            elapsed = run(handler, edge, list(messages(args.n)), False)
+
+            tracemalloc.start()
+            allocated = run(handler, edge, list(messages(args.n)), True)
+            tracemalloc.stop()
+
+            print(
+                f'{encoding:6} {name:10}: {allocated / args.n:7.0f} bytes/msg peak allocated, '
+                f'{args.n / elapsed:8.0f} msg/s'
+            )
+
+            if isinstance(handler, MiddlewarePath):
+                handler.close()
+
+            else:
+                client.close()
+
+            edge.close()
+
+    profiler.stop()
+    capture.close()
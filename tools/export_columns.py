@@ -0,0 +1,82 @@
+"""Export sensor history to per-device columnar .npy files for analytics.
+
+Each device gets a folder with one file per column, appended incrementally
+from the last exported DetectTime. Run from the program folder:
+    python -m tools.export_columns --out ./export --device SWPS0001 --device SWPS0002
+    python -m tools.export_columns --out ./export --source csv
+
+The csv source reads the local fallback records of this system's own device.
+Load a column without copying it:
+    numpy.load('export/SWPS0001/Temperature.npy', mmap_mode='r')
+"""
+import argparse
+import configparser
+from datetime import datetime
+from typing import Iterator, List
+
+import mysql.connector
+
+from lib.db import SELECT_SENSOR_RECORDS_NEXT
+from lib.export import ColumnarExporter, export_rows, read_local_csv
+from lib.settings import cfgPath
+
+
+def read_mysql(cnx, device_sn: str, after: datetime | None, page_size: int) -> Iterator[List]:
+    after = after or datetime(1970, 1, 1)
+    until = datetime(9999, 12, 31)
+    # Everything at the last exported DetectTime is already in the export.
+    after_id = 2 ** 63 - 1
+
+    while True:
+        cursor = cnx.cursor()
+        cursor.execute(SELECT_SENSOR_RECORDS_NEXT, (device_sn, after, after, after_id, until, page_size))
+        rows = cursor.fetchall()
+        cursor.close()
+
+        # The last column is the Id, it only orders the pages.
+        for row in rows:
+            yield list(row[:-1])
+
+        if len(rows) < page_size:
+            return
+
+        after = rows[-1][0]
+        after_id = rows[-1][-1]
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--out', required=True, help='export folder')
+    parser.add_argument('--device', action='append', default=[], help='device serial number, repeatable')
+    parser.add_argument('--source', choices=('mysql', 'csv'), default='mysql')
+    parser.add_argument('--page-size', type=int, default=10000, help='rows per query and per commit')
+    args = parser.parse_args()
+
+    cfg = configparser.ConfigParser()
+    cfg.read(cfgPath, encoding='utf-8')
+
+    if args.source == 'csv':
+        exporter = ColumnarExporter(args.out, cfg['Default']['device_sn'])
+        rows = read_local_csv(cfg['Local']['csv_path'], cfg['Default']['sys_encoding'], exporter.last_detect_time())
+        print(f'{exporter.device_sn}: {export_rows(exporter, rows, args.page_size)} rows, {exporter.count} total')
+        exporter.close()
+
+    else:
+        if not args.device:
+            parser.error('--device is required for the mysql source')
+
+        cnx = mysql.connector.connect(
+            host=cfg['SQL']['host'],
+            port=int(cfg['SQL']['port']),
+            user=cfg['SQL']['user'],
+            password=cfg['SQL']['password'],
+            database=cfg['SQL']['database']
+        )
+
+        for device_sn in args.device:
+            exporter = ColumnarExporter(args.out, device_sn)
+            rows = read_mysql(cnx, device_sn, exporter.last_detect_time(), args.page_size)
+            print(f'{device_sn}: {export_rows(exporter, rows, args.page_size)} rows, {exporter.count} total')
+            exporter.close()
+
+        cnx.close()
@@ -0,0 +1,170 @@
+"""Replay captured edge sessions against a test server.
+
+Sessions start at their captured offsets, so bursts such as the morning
+reconnect storm are reproduced. Run from the program folder:
+    python -m tools.replay capture.bin --host 127.0.0.1 --port 9000 --speed 10 --copies 20
+
+Use --speed 0 to send as fast as possible. Each copy gets its own DeviceSN suffix,
+--encoding must match the sys_encoding of the captured server. Runs appended to the
+same capture file are replayed back to back.
+"""
+import argparse
+import json
+import socket
+import statistics
+import threading
+import time
+from typing import Dict, List, Tuple
+
+from lib.capture import DIR_IN, DIR_CLOSE, DIR_RUN, read_capture
+from lib.codec import is_struct_frame
+
+
+def load_sessions(path: str) -> Dict[Tuple[int, int], List[Tuple[float, bytes]]]:
+    """Group received messages by run and session.
+
+    :param path: capture file
+    :return: messages with their offset in sec. from the start of the replay
+    """
+    sessions = {}
+    run = 0
+    run_start = None
+    # The idle time between runs is left out, each run starts where the previous one ended.
+    base = 0.
+    last = 0.
+
+    for stamp, session_id, direction, data in read_capture(path):
+        if direction == DIR_RUN:
+            run += 1
+            run_start = stamp
+            base = last
+            continue
+
+        if run_start is None:
+            run_start = stamp
+
+        offset = base + stamp - run_start
+        last = max(last, offset)
+
+        if direction == DIR_IN:
+            sessions.setdefault((run, session_id), []).append((offset, data))
+
+        elif direction == DIR_CLOSE:
+            sessions.setdefault((run, session_id), [])
+
+    return sessions
+
+
+def rewrite_sn(data: bytes, suffix: str, encoding: str) -> bytes:
+    """Append a suffix to the DeviceSN of a JSON message, raises ValueError for malformed messages."""
+    # Struct frames carry no DeviceSN, the session is bound by setup_edge.
+    if not suffix or is_struct_frame(data):
+        return data
+
+    msg = json.loads(data.decode(encoding))
+    if isinstance(msg, dict) and isinstance(msg.get('Data'), dict) and 'DeviceSN' in msg['Data']:
+        msg['Data']['DeviceSN'] = f"{msg['Data']['DeviceSN']}{suffix}"
+
+    return json.dumps(msg).encode(encoding)
+
+
+class Replayer:
+    def __init__(self, host: str, port: int, speed: float, timeout: float, bufsize: int, encoding: str) -> None:
+        self.host = host
+        self.port = port
+        self.speed = speed
+        self.timeout = timeout
+        self.bufsize = bufsize
+        self.encoding = encoding
+
+        self.latency = []
+        self.errors = 0
+        self.skipped = 0
+        self._lock = threading.Lock()
+
+    def _wait(self, start: float, offset: float) -> None:
+        if self.speed > 0:
+            delay = start + offset / self.speed - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+
+    def session(self, start: float, msgs: List[Tuple[float, bytes]], suffix: str) -> None:
+        if not msgs:
+            return
+
+        latency = []
+        skipped = 0
+        self._wait(start, msgs[0][0])
+
+        try:
+            with socket.create_connection((self.host, self.port), timeout=self.timeout) as c:
+                for offset, data in msgs:
+                    try:
+                        data = rewrite_sn(data, suffix, self.encoding)
+
+                    except ValueError:
+                        # Malformed capture record, the server would have rejected it as well.
+                        skipped += 1
+                        continue
+
+                    self._wait(start, offset)
+
+                    sent = time.perf_counter()
+                    c.sendall(data)
+                    if not c.recv(self.bufsize):
+                        raise ConnectionError('Connection closed by server')
+
+                    latency.append(time.perf_counter() - sent)
+
+        except OSError:
+            with self._lock:
+                self.errors += 1
+
+        with self._lock:
+            self.latency.extend(latency)
+            self.skipped += skipped
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('capture', help='capture file written by the server')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, required=True)
+    parser.add_argument('--speed', type=float, default=1., help='time scale, 0 for as fast as possible')
+    parser.add_argument('--copies', type=int, default=1, help='concurrent copies of the capture')
+    parser.add_argument('--timeout', type=float, default=10.)
+    parser.add_argument('--bufsize', type=int, default=2048)
+    parser.add_argument('--encoding', default='utf-8', help='sys_encoding of the captured server')
+    args = parser.parse_args()
+
+    sessions = load_sessions(args.capture)
+    replayer = Replayer(args.host, args.port, args.speed, args.timeout, args.bufsize, args.encoding)
+
+    start = time.perf_counter()
+    threads = []
+    for copy in range(args.copies):
+        suffix = f'-R{copy}' if args.copies > 1 else ''
+
+        for msgs in sessions.values():
+            t = threading.Thread(target=replayer.session, args=(start, msgs, suffix))
+            threads.append(t)
+            t.start()
+
+    for t in threads:
+        t.join()
+
+    elapsed = time.perf_counter() - start
+    latency = sorted(replayer.latency)
+
+    print(
+        f'sessions: {len(threads)}, messages: {len(latency)}, failed sessions: {replayer.errors}, '
+        f'skipped messages: {replayer.skipped}'
+    )
+    print(f'elapsed: {elapsed:.2f}s, throughput: {len(latency) / elapsed:.1f} msg/s')
+
+    if latency:
+        print(
+            f'latency: p50 {statistics.median(latency) * 1000:.1f}ms, '
+            f'p95 {latency[max(0, int(len(latency) * 0.95) - 1)] * 1000:.1f}ms, '
+            f'max {latency[-1] * 1000:.1f}ms'
+        )